@@ -0,0 +1,464 @@
+"""Offline benchmark for lolbot_v2.
+
+Runs the bot's polling and command code against a local fake Riot API and a fake
+Discord channel, for a range of registered account counts, and writes the results
+to a JSON file that can be compared with an earlier run.
+
+    python benchmark.py --accounts 10,100,1000,5000 --output bench_results.json
+    python benchmark.py --baseline bench_results.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+TIERS = ["IRON", "BRONZE", "SILVER", "GOLD", "PLATINUM", "EMERALD", "DIAMOND"]
+DIVISIONS = ["IV", "III", "II", "I"]
+CHAMPIONS = {
+    "145": {"id": "Kaisa", "key": "145", "name": "Kai'Sa"},
+    "20": {"id": "Nunu", "key": "20", "name": "Nunu & Willump"},
+    "62": {"id": "MonkeyKing", "key": "62", "name": "Wukong"},
+    "103": {"id": "Ahri", "key": "103", "name": "Ahri"},
+}
+GROUP_SIZE = 5  # Registered players in the same group always queue together
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.5) * 1000, 2) if values else None,
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2) if values else None,
+        "max_ms": round(max(values) * 1000, 2) if values else None,
+    }
+
+# Fake Riot API
+class FakeRiotAPI:
+    """Just enough of the Riot and Data Dragon APIs for the bot, with latency, limits and 429s."""
+
+    def __init__(self, latency, jitter, error_rate, app_limit, method_limit, new_match_rate, rank_change_rate):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.app_limit = app_limit
+        self.method_limit = method_limit
+        self.new_match_rate = new_match_rate
+        self.rank_change_rate = rank_change_rate
+        self.requests = defaultdict(int)  # endpoint -> requests served, including 429s
+        self.total_requests = 0
+        self.rate_limited = 0
+        self.windows = {}                 # (scope, seconds) -> [window_start, count]
+        self.group_matches = defaultdict(int)
+        self.ranks = {}
+        self.rng = random.Random(1234)
+
+    def application(self):
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get("/ddragon/api/versions.json", self.versions, name="ddragon.versions")
+        app.router.add_get("/ddragon/cdn/{version}/data/en_US/champion.json", self.champions, name="ddragon.champions")
+        app.router.add_get("/{region}/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}", self.account, name="account-v1.by-riot-id")
+        app.router.add_get("/{region}/lol/summoner/v4/summoners/by-puuid/{puuid}", self.summoner, name="summoner-v4.by-puuid")
+        app.router.add_get("/{region}/lol/league/v4/entries/by-summoner/{summoner_id}", self.league_entries, name="league-v4.entries-by-summoner")
+        app.router.add_get("/{region}/lol/match/v5/matches/by-puuid/{puuid}/ids", self.match_ids, name="match-v5.ids-by-puuid")
+        app.router.add_get("/{region}/lol/match/v5/matches/{match_id}", self.match, name="match-v5.match")
+        app.router.add_get(
+            "/{region}/lol/champion-mastery/v4/champion-masteries/by-puuid/{puuid}/by-champion/{champion_id}",
+            self.mastery, name="champion-mastery-v4.by-champion"
+        )
+        app.router.add_get(
+            "/{region}/lol/champion-mastery/v4/champion-masteries/by-puuid/{puuid}",
+            self.masteries, name="champion-mastery-v4.by-puuid"
+        )
+        return app
+
+    def _count(self, scope, limits, now):
+        """Count a request in fixed windows and return the counts, or None when over a limit."""
+        counts = []
+        for limit, seconds in limits:
+            window = self.windows.get((scope, seconds))
+            if window is None or now - window[0] >= seconds:
+                window = self.windows[(scope, seconds)] = [now, 0]
+            if window[1] >= limit:
+                return None
+            counts.append((window, seconds))
+        for window, seconds in counts:
+            window[1] += 1
+        return ",".join(f"{window[1]}:{seconds}" for window, seconds in counts)
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        endpoint = request.match_info.route.name
+        self.requests[endpoint] += 1
+        self.total_requests += 1
+        await asyncio.sleep(max(self.latency + self.rng.uniform(-self.jitter, self.jitter), 0))
+        if endpoint.startswith("ddragon."):
+            return await handler(request)
+
+        region = request.match_info["region"]
+        now = time.monotonic()
+        app_count = self._count(("app", region), self.app_limit, now)
+        method_count = self._count(("method", region, endpoint), self.method_limit, now) if app_count else None
+        if app_count is None or method_count is None or self.rng.random() < self.error_rate:
+            self.rate_limited += 1
+            return web.json_response(
+                {"status": {"status_code": 429, "message": "Rate limit exceeded"}},
+                status=429,
+                headers={"Retry-After": "1", "X-Rate-Limit-Type": "application" if app_count is None else "method"}
+            )
+
+        response = await handler(request)
+        response.headers["X-App-Rate-Limit"] = ",".join(f"{limit}:{seconds}" for limit, seconds in self.app_limit)
+        response.headers["X-App-Rate-Limit-Count"] = app_count
+        response.headers["X-Method-Rate-Limit"] = ",".join(f"{limit}:{seconds}" for limit, seconds in self.method_limit)
+        response.headers["X-Method-Rate-Limit-Count"] = method_count
+        return response
+
+    async def versions(self, request):
+        return web.json_response(["14.1.1", "13.24.1"])
+
+    async def champions(self, request):
+        return web.json_response({"data": {champ["id"]: champ for champ in CHAMPIONS.values()}})
+
+    async def account(self, request):
+        return web.json_response({"puuid": f"puuid-{request.match_info['game_name']}"})
+
+    async def summoner(self, request):
+        return web.json_response({"id": f"summoner-{request.match_info['puuid']}"})
+
+    async def league_entries(self, request):
+        summoner_id = request.match_info["summoner_id"]
+        rank = self.ranks.get(summoner_id)
+        if rank is None or self.rng.random() < self.rank_change_rate:
+            rank = self.ranks[summoner_id] = (self.rng.choice(TIERS), self.rng.choice(DIVISIONS), self.rng.randint(0, 99))
+        tier, division, league_points = rank
+        return web.json_response([
+            {"queueType": "RANKED_SOLO_5x5", "tier": tier, "rank": division, "leaguePoints": league_points}
+        ])
+
+    def _group(self, puuid):
+        try:
+            return int(puuid.rsplit("Player", 1)[1]) // GROUP_SIZE
+        except (IndexError, ValueError):
+            return -1
+
+    async def match_ids(self, request):
+        group = self._group(request.match_info["puuid"])
+        if self.rng.random() < self.new_match_rate:
+            self.group_matches[group] += 1
+        start = int(request.query.get("start", 0))
+        count = int(request.query.get("count", 20))
+        newest = self.group_matches[group]
+        return web.json_response([f"EUW1_{group}_{k}" for k in range(newest - start, max(newest - start - count, 0), -1)])
+
+    async def match(self, request):
+        _, group, number = request.match_info["match_id"].split("_")
+        group, number = int(group), int(number)
+        win = (group + number) % 2 == 0
+        participants = [{"puuid": f"puuid-Player{group * GROUP_SIZE + i}", "win": win} for i in range(GROUP_SIZE)]
+        participants += [{"puuid": f"puuid-filler{i}", "win": not win} for i in range(GROUP_SIZE)]
+        return web.json_response({
+            "metadata": {"matchId": request.match_info["match_id"]},
+            "info": {"queueId": 420, "gameCreation": number, "gameEndTimestamp": number, "participants": participants}
+        })
+
+    async def mastery(self, request):
+        return web.json_response({
+            "championId": int(request.match_info["champion_id"]),
+            "championLevel": 7,
+            "championPoints": 123456
+        })
+
+    async def masteries(self, request):
+        return web.json_response([
+            {"championId": champion_id, "championLevel": 7, "championPoints": 123456 - champion_id}
+            for champion_id in range(1, 171)
+        ])
+
+# Fake Discord
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.roles = []
+
+class FakeChannel:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        self.messages.append(content if content is not None else kwargs)
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def send_message(self, content=None, **kwargs):
+        self.done = True
+        self.interaction.replied_at = time.perf_counter()
+        self.interaction.messages.append(content)
+
+    async def defer(self, **kwargs):
+        self.done = True
+        self.interaction.deferred_at = time.perf_counter()
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        self.interaction.replied_at = time.perf_counter()
+        self.interaction.messages.append(content)
+
+class FakeInteraction:
+    def __init__(self, user):
+        self.user = user
+        self.guild = None
+        self.messages = []
+        self.deferred_at = None
+        self.replied_at = None
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+# Harness
+async def monitor_loop_lag(samples, interval=0.01):
+    """Record how late the event loop wakes us up, i.e. how long something blocked it."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(time.perf_counter() - started - interval, 0))
+
+def instrument(lolbot, latencies):
+    """Time every get_with_retry call by endpoint, as seen by the bot (limiter waits and retries included)."""
+    original = lolbot.get_with_retry
+
+    async def timed_get_with_retry(url, region=None, endpoint=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await original(url, region, endpoint, *args, **kwargs)
+        finally:
+            latencies[endpoint or "ddragon"].append(time.perf_counter() - started)
+
+    lolbot.get_with_retry = timed_get_with_retry
+
+def load_bot(workdir, settings):
+    """Import lolbot_v2 with a fresh config.json, state files and caches in workdir."""
+    os.chdir(workdir)
+    with open("config.json", "w") as f:
+        json.dump(settings, f)
+    if "lolbot_v2" in sys.modules:
+        return importlib.reload(sys.modules["lolbot_v2"])
+    sys.path.insert(0, BOT_DIR)
+    return importlib.import_module("lolbot_v2")
+
+def seed_accounts(lolbot, count):
+    for i in range(count):
+        discord_id = 100000 + i // 2  # Two Riot IDs per Discord user
+        lolbot.player_data.setdefault(discord_id, {})[f"Player{i}#BENCH"] = lolbot.Account(
+            f"puuid-Player{i}", f"summoner-puuid-Player{i}"
+        )
+
+def make_all_due(lolbot):
+    for discord_id, riot_id_data in lolbot.player_data.items():
+        for riot_id in riot_id_data:
+            lolbot.poll_scheduler.schedule((discord_id, riot_id), 0)
+
+async def run_scenario(accounts, args, api, base_url):
+    settings = {
+        "api_key": "benchmark",
+        "bot_token": "benchmark",
+        "channel_id": 1,
+        "required_role_id": 0,
+        "riot_api_url": f"{base_url}/{{region}}",
+        "ddragon_url": f"{base_url}/ddragon",
+        "app_rate_limit": args.app_limit,
+        "poll_concurrency": args.concurrency,
+        "announce_interval": 0,
+        "request_cache_ttls": {},  # Cycles run back to back, reused responses would hide the real cost
+    }
+    lolbot = load_bot(tempfile.mkdtemp(prefix=f"lolbot-bench-{accounts}-"), settings)
+
+    channel = FakeChannel()
+    lolbot.bot.get_channel = lambda channel_id: channel
+    lolbot.bot.get_user = lambda user_id: FakeUser(user_id)
+
+    async def fetch_user(user_id):
+        return FakeUser(user_id)
+    lolbot.bot.fetch_user = fetch_user
+
+    latencies = defaultdict(list)
+    instrument(lolbot, latencies)
+    seed_accounts(lolbot, accounts)
+
+    lag_samples = []
+    lag_task = asyncio.create_task(monitor_loop_lag(lag_samples))
+    lolbot.notifications.start()
+    result = {"accounts": accounts, "cycles": []}
+    try:
+        # Restart cost: write every account, then load them back the way startup() does
+        for discord_id, riot_id_data in lolbot.player_data.items():
+            for riot_id in riot_id_data:
+                lolbot.mark_dirty(discord_id, riot_id)
+        await lolbot.save_player_data()
+        started = time.perf_counter()
+        await lolbot.load_player_data()
+        result["state_load_seconds"] = round(time.perf_counter() - started, 3)
+
+        for _ in range(args.cycles):
+            make_all_due(lolbot)
+            requests_before = api.total_requests
+            limited_before = api.rate_limited
+            started = time.perf_counter()
+            await lolbot.check_for_updates()
+            wall = time.perf_counter() - started
+            while lolbot.notifications.depth():
+                await asyncio.sleep(0.01)
+            result["cycles"].append({
+                "wall_seconds": round(wall, 3),
+                "announce_drain_seconds": round(time.perf_counter() - started - wall, 3),
+                "requests": api.total_requests - requests_before,
+                "rate_limited": api.rate_limited - limited_before,
+            })
+
+        register_times = []
+        for i in range(args.registers):
+            interaction = FakeInteraction(FakeUser(900000 + i))
+            started = time.perf_counter()
+            await lolbot.register.callback(interaction, f"Player{accounts + i}#BENCH", None)
+            register_times.append(time.perf_counter() - started)
+        result["register"] = summarize(register_times)
+
+        mastery_times = []
+        first_response_times = []
+        for i in range(args.masteries):
+            interaction = FakeInteraction(FakeUser(1))
+            started = time.perf_counter()
+            await lolbot.mastery.callback(interaction, FakeUser(100000 + i % max(accounts // 2, 1)), "kaisa")
+            mastery_times.append(time.perf_counter() - started)
+            first_response_times.append((interaction.deferred_at or interaction.replied_at or started) - started)
+        result["mastery"] = summarize(mastery_times)
+        result["mastery_first_response"] = summarize(first_response_times)
+
+        leaderboard_times = []
+        for i in range(args.leaderboards):
+            interaction = FakeInteraction(FakeUser(1))
+            started = time.perf_counter()
+            await lolbot.leaderboard.callback(interaction, "solo_duo", i % 5 + 1)
+            leaderboard_times.append(time.perf_counter() - started)
+        result["leaderboard"] = summarize(leaderboard_times)
+    finally:
+        lag_task.cancel()
+        lolbot.notifications.task.cancel()
+        await lolbot.close_http_session()
+
+    result["messages_sent"] = len(channel.messages)
+    result["endpoints"] = {endpoint: summarize(values) for endpoint, values in sorted(latencies.items())}
+    result["loop_lag"] = {
+        "max_ms": round(max(lag_samples, default=0) * 1000, 2),
+        "p99_ms": round((percentile(lag_samples, 0.99) or 0) * 1000, 2),
+        "blocked_seconds": round(sum(lag for lag in lag_samples if lag > 0.005), 3),
+    }
+    return result
+
+def compare(results, baseline_path, max_regression):
+    """Print median cycle time changes against an earlier run and return False on a regression."""
+    with open(baseline_path, "r") as f:
+        baseline = {scenario["accounts"]: scenario for scenario in json.load(f)["scenarios"]}
+
+    ok = True
+    for scenario in results["scenarios"]:
+        old = baseline.get(scenario["accounts"])
+        if old is None or not old["cycles"] or not scenario["cycles"]:
+            continue
+        old_time = percentile([cycle["wall_seconds"] for cycle in old["cycles"]], 0.5)
+        new_time = percentile([cycle["wall_seconds"] for cycle in scenario["cycles"]], 0.5)
+        change = (new_time - old_time) / old_time if old_time else 0
+        regressed = change > max_regression
+        ok = ok and not regressed
+        print(f"{scenario['accounts']:>6} accounts: {old_time:.3f}s -> {new_time:.3f}s ({change:+.0%}){' REGRESSION' if regressed else ''}")
+    return ok
+
+async def main(args):
+    api = FakeRiotAPI(
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        app_limit=[tuple(map(int, part.split(":"))) for part in args.app_limit.split(",")],
+        method_limit=[tuple(map(int, part.split(":"))) for part in args.method_limit.split(",")],
+        new_match_rate=args.new_match_rate,
+        rank_change_rate=args.rank_change_rate,
+    )
+    runner = web.AppRunner(api.application(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    port = runner.addresses[0][1]
+
+    results = {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "args": vars(args),
+        },
+        "scenarios": [],
+    }
+    try:
+        for accounts in args.accounts:
+            print(f"Running scenario with {accounts} accounts...")
+            scenario = await run_scenario(accounts, args, api, f"http://127.0.0.1:{port}")
+            results["scenarios"].append(scenario)
+            wall = ", ".join(f"{cycle['wall_seconds']:.2f}s" for cycle in scenario["cycles"])
+            print(f"  cycles: {wall}, loop lag max {scenario['loop_lag']['max_ms']} ms")
+    finally:
+        await runner.cleanup()
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark lolbot_v2 against a local fake Riot API.")
+    parser.add_argument("--accounts", type=lambda v: [int(x) for x in v.split(",")], default=[10, 100, 1000, 5000])
+    parser.add_argument("--cycles", type=int, default=3, help="poll cycles per scenario, every account due in each")
+    parser.add_argument("--registers", type=int, default=10, help="/register calls per scenario")
+    parser.add_argument("--masteries", type=int, default=10, help="/mastery calls per scenario")
+    parser.add_argument("--leaderboards", type=int, default=10, help="/leaderboard calls per scenario")
+    parser.add_argument("--latency", type=float, default=30, help="fake API latency in ms")
+    parser.add_argument("--jitter", type=float, default=10, help="fake API latency jitter in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of Riot calls answered with an injected 429")
+    parser.add_argument("--app-limit", default="500:1,30000:600", help="app rate limit served by the fake API and used by the bot")
+    parser.add_argument("--method-limit", default="2000:10", help="method rate limit served by the fake API")
+    parser.add_argument("--new-match-rate", type=float, default=0.3)
+    parser.add_argument("--rank-change-rate", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=8, help="poll_concurrency for the bot")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare cycle times against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed cycle time increase over the baseline")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    results = asyncio.run(main(args))
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {output}")
+
+    if baseline and not compare(results, baseline, args.max_regression):
+        sys.exit(1)
@@ -1,9 +1,29 @@
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import hashlib
+import heapq
+import itertools
+import multiprocessing
+import random
+import sqlite3
+import sys
+import threading
 import time
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 import json
-import requests
+import os
+import aiohttp
+from aiohttp import web
+from array import array
+from collections import OrderedDict, defaultdict
+from enum import Enum
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+
+PROCESS_STARTED = time.monotonic()  # Startup timings are measured from here
 
 def load_config():
     try:
@@ -19,10 +39,50 @@ bot_token = config["bot_token"]
 CHANNEL_ID = int(config["channel_id"])
 REQUIRED_ROLE_ID = int(config["required_role_id"])
 DATABASE_FILE = "player_data.json"
+SQLITE_DATABASE_FILE = "player_data.db"
+STORAGE_BACKEND = config.get("storage_backend", "sqlite")  # "sqlite", or "json" for the old player_data.json
+SAVE_INTERVAL = int(config.get("save_interval", 30))  # Changes are flushed at most this often, and after each poll cycle
+DDRAGON_CACHE_FILE = "ddragon_cache.json"
+COMMAND_HASH_FILE = "command_hash.txt"  # Hash of the last synced slash command definitions
+POLL_CONCURRENCY = int(config.get("poll_concurrency", 8))  # Accounts polled at the same time
+POLL_TICK_SECONDS = int(config.get("poll_tick_seconds", 15))  # How often update_checker looks for due accounts
+POLL_MIN_INTERVAL = int(config.get("poll_min_interval", 60))  # Active accounts
+POLL_MAX_INTERVAL = int(config.get("poll_max_interval", 1800))  # Idle accounts back off up to this
+MATCH_PAGE_SIZE = 20
+MATCH_CATCHUP_MAX_PAGES = 5
+MATCH_CATCHUP_SECONDS = int(config.get("match_catchup_hours", 24)) * 3600  # Older missed games are not caught up
+MATCH_CACHE_MAX_BYTES = int(config.get("match_cache_mb", 16)) * 1024 * 1024
+MATCH_CACHE_FILE = config.get("match_cache_file")  # e.g. "match_cache.db", no disk tier when unset
+MATCH_DISK_CACHE_MAX_ROWS = 200000
+MATCH_HISTORY_FILE = config.get("match_history_file", "match_history.db")  # Append-only log of every account's games
+MATCH_HISTORY_GAMES = int(config.get("match_history_games", 100))  # Games per queue kept in memory, and backfilled per account
+MATCH_HISTORY_BACKFILL_CONCURRENCY = int(config.get("match_history_backfill_concurrency", 4))
+MATCH_HISTORY_BACKFILL_RESERVE = float(config.get("match_history_backfill_reserve", 0.5))  # Share of the rate limit left to polling
+MASTERY_CACHE_TTL = int(config.get("mastery_cache_ttl", 300))  # Seconds champion mastery is reused
+MASTERY_BULK = bool(config.get("mastery_bulk", True))  # Fetch all champions per account once instead of one champion per call
+USER_CACHE_TTL = int(config.get("user_cache_ttl", 3600))  # Seconds a fetched Discord user is reused
+METRICS_PORT = int(config.get("metrics_port", 9108))  # Local /metrics endpoint, 0 disables it
+POLL_WORKERS = int(config.get("poll_workers", 0))  # Worker processes polling shards of the accounts, 0 polls in-process
+WORKER_API_KEYS = config.get("worker_api_keys") or [api_key]  # Keys of the same Riot app, puuids differ between apps
+POLL_WORKER_TIMEOUT = int(config.get("poll_worker_timeout", 120))  # Seconds to wait for a worker's results
+ANNOUNCE_INTERVAL = float(config.get("announce_interval", 1.5))  # Seconds between messages to the channel
+APP_RATE_LIMIT = config.get("app_rate_limit", "20:1,100:120")  # Development key limits until Riot tells us otherwise
+INTERACTIVE_RESERVE = float(config.get("interactive_reserve", 0.2))  # Share of every rate limit window background calls leave free
+BREAKER_FAILURES = int(config.get("breaker_failures", 5))  # Consecutive 5xx errors or timeouts that open an endpoint's breaker
+BREAKER_COOLDOWN = int(config.get("breaker_cooldown", 30))  # Seconds an open breaker rejects calls before letting a probe through
+# Seconds a successful response is reused per endpoint, concurrent identical calls are always shared
+REQUEST_CACHE_TTLS = config.get("request_cache_ttls", {"ddragon": 300, "match-v5.ids-by-puuid": 5, "league-v4.entries-by-summoner": 5})
 
 # Global Variables
 player_data = {}
 
+# Base URLs, only overridden to point the bot at a local fake API (see benchmark.py)
+RIOT_API_URL = config.get("riot_api_url", "https://{region}.api.riotgames.com")
+DDRAGON_URL = config.get("ddragon_url", "https://ddragon.leagueoflegends.com")
+
+def riot_api_base(region):
+    return RIOT_API_URL.format(region=region)
+
 # Region
 API_REGIONS = {
     "account": "europe",    # Account v4
@@ -53,23 +113,1010 @@ DIVISION_VALUES = {
     "I": 3
 }
 
+TIER_NAMES = sorted(TIER_VALUES, key=TIER_VALUES.get)
+DIVISION_NAMES = sorted(DIVISION_VALUES, key=DIVISION_VALUES.get)
+
+# Account model
+class QueueType(str, Enum):
+    SOLO_DUO = "solo_duo"
+    FLEX = "flex"
+
+    def __str__(self):
+        return self.value
+
+class StreakType(str, Enum):
+    QUICKPLAY_DRAFTPICK = "quickplay/draftpick"
+    RANKED_SOLO_DUO = "ranked_solo_duo"
+    RANKED_FLEX = "ranked_flex"
+    ARAM = "aram"
+    ARENA = "arena"
+
+    def __str__(self):
+        return self.value
+
+# League v4 queueType to our queue types
+RIOT_QUEUE_TYPES = {
+    "RANKED_SOLO_5x5": QueueType.SOLO_DUO,
+    "RANKED_FLEX_SR": QueueType.FLEX
+}
+
+# Map Queue ID to Streak Type
+QUEUE_STREAK_TYPES = {
+    400: StreakType.QUICKPLAY_DRAFTPICK,
+    430: StreakType.QUICKPLAY_DRAFTPICK,
+    420: StreakType.RANKED_SOLO_DUO,
+    440: StreakType.RANKED_FLEX,
+    450: StreakType.ARAM,
+    1700: StreakType.ARENA,  # Updated to 1700 for Clash
+    # ... (Add more as needed)
+}
+
+class LeagueEntry:
+    """A rank with the tier and division stored as their TIER_VALUES / DIVISION_VALUES."""
+    __slots__ = ("tier", "division", "league_points")
+
+    def __init__(self, tier, division, league_points):
+        self.tier = tier
+        self.division = division
+        self.league_points = league_points
+
+    @classmethod
+    def from_dict(cls, data):
+        """From {"tier": "GOLD", "rank": "II", "leaguePoints": 42}, raises ValueError for unknown ranks."""
+        try:
+            return cls(TIER_VALUES[data["tier"]], DIVISION_VALUES[data["rank"]], int(data["leaguePoints"]))
+        except KeyError as e:
+            raise ValueError(f"Invalid league entry {data!r}") from e
+
+    def to_dict(self):
+        return {"tier": self.tier_name, "rank": self.division_name, "leaguePoints": self.league_points}
+
+    @property
+    def tier_name(self):
+        return TIER_NAMES[self.tier]
+
+    @property
+    def division_name(self):
+        return DIVISION_NAMES[self.division]
+
+    @property
+    def score(self):
+        """Tier and division as one number, for comparing ranks."""
+        return self.tier * len(DIVISION_NAMES) + self.division
+
+    def __eq__(self, other):
+        if not isinstance(other, LeagueEntry):
+            return NotImplemented
+        return (self.tier, self.division, self.league_points) == (other.tier, other.division, other.league_points)
+
+    def __repr__(self):
+        return f"LeagueEntry({self.tier_name} {self.division_name}, {self.league_points} LP)"
+
+class Streak:
+    __slots__ = ("wins", "losses")
+
+    def __init__(self, wins=0, losses=0):
+        self.wins = wins
+        self.losses = losses
+
+    def record(self, win):
+        if win:
+            self.wins += 1
+            self.losses = 0
+        else:
+            self.losses += 1
+            self.wins = 0
+
+class Account:
+    """One registered Riot ID. Converts to and from the player_data.json schema."""
+    __slots__ = ("puuid", "summoner_id", "last_match_id", "last_queue_type", "league_entries", "streaks")
+
+    def __init__(self, puuid, summoner_id, last_match_id=None, last_queue_type=None, league_entries=None, streaks=None):
+        self.puuid = puuid
+        self.summoner_id = summoner_id
+        self.last_match_id = last_match_id
+        self.last_queue_type = last_queue_type                  # StreakType or None
+        self.league_entries = league_entries or {}              # QueueType -> LeagueEntry
+        self.streaks = streaks or {streak_type: Streak() for streak_type in StreakType}
+
+    @classmethod
+    def from_dict(cls, data):
+        league_entries = {}
+        for queue_type, entry in (data.get("league_entries") or {}).items():
+            try:
+                league_entries[QueueType(queue_type)] = LeagueEntry.from_dict(entry)
+            except ValueError as e:
+                print(f"Skipping league entry {queue_type}: {e}")
+
+        streaks = {streak_type: Streak() for streak_type in StreakType}
+        for streak_type, streak in (data.get("streaks") or {}).items():
+            if streak_type in StreakType._value2member_map_:
+                streaks[StreakType(streak_type)] = Streak(streak["wins"], streak["losses"])
+
+        last_queue_type = data.get("last_queue_type")
+        return cls(
+            data["puuid"],
+            data["summoner_id"],
+            data.get("last_match_id"),
+            StreakType(last_queue_type) if last_queue_type in StreakType._value2member_map_ else None,
+            league_entries,
+            streaks
+        )
+
+    def to_dict(self):
+        return {
+            "puuid": self.puuid,
+            "summoner_id": self.summoner_id,
+            "league_entries": {queue_type.value: entry.to_dict() for queue_type, entry in self.league_entries.items()},
+            "last_match_id": self.last_match_id,
+            "streaks": {streak_type.value: {"wins": streak.wins, "losses": streak.losses} for streak_type, streak in self.streaks.items()},
+            "last_queue_type": self.last_queue_type.value if self.last_queue_type else None
+        }
+
+# Metrics
+class Metrics:
+    """Counters, gauges and histograms with labels, rendered in the Prometheus text format."""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.counters = defaultdict(float)  # (name, labels) -> value
+        self.gauges = {}                    # (name, labels) -> value
+        self.histograms = {}                # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self.collectors = []                # Called before rendering to refresh gauges from other stats
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        self.counters[self._key(name, labels)] += value
+
+    def set(self, name, value, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def set_total(self, name, value, **labels):
+        """Export a running total kept elsewhere as a counter."""
+        self.counters[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [0] * (len(self.BUCKETS) + 2)
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(self.BUCKETS)] += 1
+        histogram[-1] += value
+
+    def summary(self, name):
+        """(labels, count, sum) for every label set of a histogram."""
+        return [
+            (dict(labels), sum(histogram[:-1]), histogram[-1])
+            for (metric, labels), histogram in sorted(self.histograms.items())
+            if metric == name
+        ]
+
+    def collect(self):
+        for collector in self.collectors:
+            try:
+                collector(self)
+            except Exception as e:
+                print(f"Error in metrics collector: {e!r}")
+
+    def render(self):
+        self.collect()
+        lines = []
+        for kind, values in (("counter", self.counters), ("gauge", self.gauges)):
+            seen = set()
+            for (name, labels), value in sorted(values.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{self._labels(labels)} {value}")
+
+        seen = set()
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, histogram):
+                cumulative += count
+                lines.append(f"{name}_bucket{self._labels(labels + (('le', str(bound)),))} {cumulative}")
+            cumulative += histogram[len(self.BUCKETS)]
+            lines.append(f"{name}_bucket{self._labels(labels + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{self._labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+metrics = Metrics()
+
+async def handle_metrics(request):
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+async def start_metrics_server(port):
+    """Serve /metrics on localhost only, for a Prometheus scraper running next to the bot."""
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+    except OSError as e:
+        print(f"Error starting metrics server on port {port}: {e}")
+        await runner.cleanup()
+        return None
+    print(f"Metrics available at http://127.0.0.1:{port}/metrics")
+    return runner
+
+async def monitor_event_loop_lag(interval=0.5):
+    """Measure how late the loop wakes us up, which is how long something blocked it."""
+    while True:
+        expected = time.monotonic() + interval
+        await asyncio.sleep(interval)
+        lag = max(time.monotonic() - expected, 0)
+        metrics.set("lolbot_event_loop_last_lag_seconds", lag)
+        metrics.observe("lolbot_event_loop_lag_seconds", lag)
+
+# HTTP
+# One shared session for the whole bot. The connector keeps a keep-alive pool per host
+# (europe, euw1, ddragon), so consecutive Riot calls reuse their TLS connections.
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=15, connect=5)
+HTTP_CONNECTIONS_PER_HOST = 10
+http_session = None
+
+class RiotResponse:
+    """A fully read HTTP response, usable after its connection went back to the pool."""
+
+    def __init__(self, status_code, headers, text):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+        self.parsed = None
+
+    def json(self):
+        # Parsed once, single-flight callers share the response (and must not modify the result)
+        if self.parsed is None:
+            self.parsed = json.loads(self.text)
+        return self.parsed
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPStatusError(self)
+
+class HTTPStatusError(aiohttp.ClientError):
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+def get_http_session():
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit_per_host=HTTP_CONNECTIONS_PER_HOST,
+            keepalive_timeout=60,
+            ttl_dns_cache=300
+        )
+        http_session = aiohttp.ClientSession(connector=connector, timeout=HTTP_TIMEOUT)
+    return http_session
+
+async def close_http_session():
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+
+class SingleFlight:
+    """Identical concurrent GETs share one request; endpoints with a TTL also reuse the result for a while."""
+
+    def __init__(self, ttls, max_results=1000):
+        self.ttls = ttls
+        self.max_results = max_results
+        self.in_flight = {}  # canonical url -> task
+        self.results = {}    # canonical url -> (response, expires_at)
+        self.stats = defaultdict(lambda: {"requests": 0, "coalesced": 0, "cached": 0})  # endpoint -> counts
+
+    @staticmethod
+    def canonical_url(url):
+        """The URL without api_key and with sorted query parameters, so equal requests get equal keys."""
+        parts = urlsplit(url)
+        query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "api_key")
+        return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urlencode(query), ""))
+
+    async def run(self, url, endpoint, fetch):
+        """Return fetch()'s result, sharing it with every caller of the same URL while it runs."""
+        key = self.canonical_url(url)
+        stats = self.stats[endpoint]
+        cached = self.results.get(key)
+        if cached is not None:
+            if cached[1] > time.monotonic():
+                stats["cached"] += 1
+                return cached[0]
+            del self.results[key]
+
+        task = self.in_flight.get(key)
+        if task is None:
+            stats["requests"] += 1
+            task = self.in_flight[key] = asyncio.create_task(fetch())
+            task.add_done_callback(lambda done: self._finish(key, endpoint, done))
+        else:
+            stats["coalesced"] += 1
+        # A cancelled caller must not cancel the request for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key, endpoint, task):
+        self.in_flight.pop(key, None)
+        ttl = self.ttls.get(endpoint, 0)
+        if task.cancelled() or task.exception() is not None or not ttl:
+            return
+        now = time.monotonic()
+        if len(self.results) >= self.max_results:
+            for expired in [k for k, (_, expires_at) in self.results.items() if expires_at <= now]:
+                del self.results[expired]
+        if len(self.results) < self.max_results:
+            self.results[key] = (task.result(), now + ttl)
+
+single_flight = SingleFlight(REQUEST_CACHE_TTLS)
+
+# Rate limiting
+def parse_rate_limit_header(value):
+    """Parse a Riot rate limit header such as "20:1,100:120" into [(20, 1), (100, 120)]."""
+    pairs = []
+    for part in (value or "").split(","):
+        try:
+            count, seconds = part.split(":")
+            pairs.append((int(count), int(seconds)))
+        except ValueError:
+            continue
+    return pairs
+
+class RateLimitWindow:
+    """A fixed window that starts with its first request, the way Riot counts them."""
+    __slots__ = ("limit", "seconds", "count", "reset_at")
+
+    def __init__(self, limit, seconds):
+        self.limit = limit
+        self.seconds = seconds
+        self.count = 0
+        self.reset_at = None
+
+    def roll(self, now):
+        if self.reset_at is not None and now >= self.reset_at:
+            self.count = 0
+            self.reset_at = None
+
+    def reserved(self, reserved_share):
+        return min(int(self.limit * reserved_share), self.limit - 1) if reserved_share else 0
+
+    def wait_time(self, now, reserved_share=0.0):
+        """Seconds until a request fits, keeping reserved_share of the window free for others."""
+        self.roll(now)
+        if self.count < self.limit - self.reserved(reserved_share):
+            return 0
+        return self.reset_at - now
+
+    def reserve(self, now):
+        self.roll(now)
+        if self.reset_at is None:
+            self.reset_at = now + self.seconds
+        self.count += 1
+
+    def remaining(self, now, reserved_share=0.0):
+        self.roll(now)
+        return max(self.limit - self.reserved(reserved_share) - self.count, 0)
+
+class RateLimitBucket:
+    """All windows of one limit (app limit of a region, or method limit of an endpoint)."""
+
+    def __init__(self, limits=()):
+        self.windows = [RateLimitWindow(limit, seconds) for limit, seconds in limits]
+        self.blocked_until = 0
+
+    def wait_time(self, now, reserved_share=0.0):
+        waits = [window.wait_time(now, reserved_share) for window in self.windows]
+        waits.append(self.blocked_until - now)
+        return max(waits)
+
+    def reserve(self, now):
+        for window in self.windows:
+            window.reserve(now)
+
+    def sync(self, limits, counts, now):
+        # Riot may change the limits (e.g. production key), so rebuild windows but keep our counts
+        if limits and [(w.limit, w.seconds) for w in self.windows] != limits:
+            old = {w.seconds: w for w in self.windows}
+            self.windows = []
+            for limit, seconds in limits:
+                window = old.get(seconds) or RateLimitWindow(limit, seconds)
+                window.limit = limit
+                self.windows.append(window)
+
+        # The server count includes requests we didn't see (other processes using the key)
+        server_counts = dict((seconds, count) for count, seconds in counts)
+        for window in self.windows:
+            server_count = server_counts.get(window.seconds)
+            if server_count is None:
+                continue
+            window.roll(now)
+            if window.reset_at is None:
+                window.reset_at = now + window.seconds
+            window.count = max(window.count, server_count)
+
+    def remaining(self, now, horizon=0, reserved_share=0.0):
+        """Requests left in the windows at least horizon seconds long, None if there are none."""
+        windows = [window for window in self.windows if window.seconds >= horizon]
+        if not windows:
+            return None
+        return min(window.remaining(now, reserved_share) for window in windows)
+
+# Priority lanes: slash commands go first, polling and other background work uses what is left
+LANE_INTERACTIVE = "interactive"
+LANE_BACKGROUND = "background"
+LANE_PRIORITIES = {LANE_INTERACTIVE: 0, LANE_BACKGROUND: 1}
+request_lane = contextvars.ContextVar("request_lane", default=LANE_INTERACTIVE)
+
+@contextlib.contextmanager
+def request_priority(lane):
+    """Send the Riot calls made inside (and in tasks started inside) through the given lane."""
+    token = request_lane.set(lane)
+    try:
+        yield
+    finally:
+        request_lane.reset(token)
+
+class RiotRateLimiter:
+    """Client side limiter with an app bucket per routing region and a method bucket per endpoint.
+
+    Waiters of an endpoint queue by lane, then arrival. Background calls also leave
+    reserved_share of every window free, so interactive calls rarely wait at all.
+    """
+
+    def __init__(self, app_limits, reserved_share=0.0, share=1.0):
+        self.app_limits = app_limits
+        self.reserved_share = reserved_share
+        self.share = share  # Part of the key's limits this process may use, when other processes use the same key
+        self.app_buckets = {}     # region -> RateLimitBucket
+        self.method_buckets = {}  # (region, endpoint) -> RateLimitBucket
+        self.queues = {}          # (region, endpoint) -> heap of (lane priority, sequence, wake event)
+        self.sequence = itertools.count()
+        self.total_wait = 0.0
+        self.lanes = {lane: {"queued": 0, "requests": 0, "wait": 0.0} for lane in LANE_PRIORITIES}
+
+    def _app_bucket(self, region):
+        app_bucket = self.app_buckets.get(region)
+        if app_bucket is None:
+            app_bucket = self.app_buckets[region] = RateLimitBucket(self._scale(self.app_limits))
+        return app_bucket
+
+    def _buckets(self, region, endpoint):
+        app_bucket = self._app_bucket(region)
+        method_bucket = self.method_buckets.get((region, endpoint))
+        if method_bucket is None:
+            method_bucket = self.method_buckets[(region, endpoint)] = RateLimitBucket()
+        return app_bucket, method_bucket
+
+    async def acquire(self, region, endpoint, lane=LANE_INTERACTIVE):
+        """Wait until it's our turn and both buckets have capacity, then reserve a slot in each."""
+        queue = self.queues.setdefault((region, endpoint), [])
+        entry = (LANE_PRIORITIES[lane], next(self.sequence), asyncio.Event())
+        head = queue[0] if queue else None
+        heapq.heappush(queue, entry)
+        if head is not None and queue[0] is entry:
+            head[2].set()  # The old head re-checks and steps back behind us
+        stats = self.lanes[lane]
+        stats["queued"] += 1
+        started = time.monotonic()
+        reserved_share = self.reserved_share if lane == LANE_BACKGROUND else 0.0
+        buckets = self._buckets(region, endpoint)
+        try:
+            while True:
+                event = entry[2]
+                event.clear()
+                if queue[0] is not entry:
+                    await event.wait()
+                    continue
+                now = time.monotonic()
+                wait = max(bucket.wait_time(now, reserved_share) for bucket in buckets)
+                if wait <= 0:
+                    for bucket in buckets:
+                        bucket.reserve(now)
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            stats["queued"] -= 1
+            if queue[0] is entry:
+                heapq.heappop(queue)
+            else:  # Cancelled while waiting
+                queue.remove(entry)
+                heapq.heapify(queue)
+            if queue:
+                queue[0][2].set()
+        waited = time.monotonic() - started
+        self.total_wait += waited
+        stats["requests"] += 1
+        stats["wait"] += waited
+        return waited
+
+    def _scale(self, pairs, round_up=False):
+        """Scale (count, seconds) pairs of the whole key down to this process's share."""
+        if self.share >= 1:
+            return pairs
+        if round_up:
+            return [(int(-(-count * self.share // 1)), seconds) for count, seconds in pairs]
+        return [(max(int(count * self.share), 1), seconds) for count, seconds in pairs]
+
+    def set_share(self, share):
+        """Change this process's share of the key, rescaling the windows we already have."""
+        factor = share / self.share
+        self.share = share
+        for bucket in list(self.app_buckets.values()) + list(self.method_buckets.values()):
+            for window in bucket.windows:
+                window.limit = max(int(window.limit * factor), 1)
+
+    def update(self, region, endpoint, headers):
+        # Riot's limits and counts are for the whole key. With a share below 1 we assume the
+        # other processes use about as much as we do, and scale both.
+        now = time.monotonic()
+        app_bucket, method_bucket = self._buckets(region, endpoint)
+        app_bucket.sync(
+            self._scale(parse_rate_limit_header(headers.get("X-App-Rate-Limit"))),
+            self._scale(parse_rate_limit_header(headers.get("X-App-Rate-Limit-Count")), round_up=True),
+            now
+        )
+        method_bucket.sync(
+            self._scale(parse_rate_limit_header(headers.get("X-Method-Rate-Limit"))),
+            self._scale(parse_rate_limit_header(headers.get("X-Method-Rate-Limit-Count")), round_up=True),
+            now
+        )
+
+    def penalize(self, region, endpoint, retry_after, limit_type=None):
+        """Block the bucket a 429 was reported for until Retry-After has passed."""
+        app_bucket, method_bucket = self._buckets(region, endpoint)
+        bucket = app_bucket if limit_type == "application" else method_bucket
+        bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+
+    def headroom(self, region, endpoint=None, horizon=0, lane=LANE_INTERACTIVE):
+        """Requests of the lane that can still go out, or None when nothing limits them.
+
+        With a horizon, windows shorter than it are ignored: they refill before that time is up.
+        """
+        reserved_share = self.reserved_share if lane == LANE_BACKGROUND else 0.0
+        now = time.monotonic()
+        buckets = self._buckets(region, endpoint) if endpoint else (self._app_bucket(region),)
+        if any(bucket.blocked_until > now for bucket in buckets):
+            return 0
+        remaining = [r for r in (bucket.remaining(now, horizon, reserved_share) for bucket in buckets) if r is not None]
+        return min(remaining) if remaining else None
+
+    def free_share(self, region):
+        """Share of the region's tightest app window that is still free, 1.0 when nothing limits it."""
+        now = time.monotonic()
+        bucket = self._app_bucket(region)
+        if bucket.blocked_until > now:
+            return 0.0
+        return min((window.remaining(now) / window.limit for window in bucket.windows if window.limit), default=1.0)
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {
+            "app": {region: bucket.remaining(now) for region, bucket in self.app_buckets.items()},
+            "method": {f"{region}/{endpoint}": bucket.remaining(now) for (region, endpoint), bucket in self.method_buckets.items()},
+            "total_wait": round(self.total_wait, 3),
+            "lanes": {lane: dict(stats) for lane, stats in self.lanes.items()}
+        }
+
+rate_limiter = RiotRateLimiter(parse_rate_limit_header(APP_RATE_LIMIT), INTERACTIVE_RESERVE)
+
+# Circuit breaking
+class CircuitOpenError(aiohttp.ClientError):
+    """Raised instead of calling an endpoint whose breaker is open."""
+
+class CircuitBreaker:
+    """Breaker of one region and endpoint: closed, open after repeated failures, half-open while probing."""
+    __slots__ = ("state", "failures", "retry_at")
+
+    def __init__(self):
+        self.state = "closed"
+        self.failures = 0
+        self.retry_at = 0  # When open: the first probe. When half-open: when another probe may go out
+
+class CircuitBreakers:
+    STATES = {"closed": 0, "half_open": 1, "open": 2}  # Gauge values
+
+    def __init__(self, failures, cooldown):
+        self.failure_threshold = failures
+        self.cooldown = cooldown
+        self.breakers = {}  # (region, endpoint) -> CircuitBreaker
+
+    def _breaker(self, region, endpoint):
+        breaker = self.breakers.get((region, endpoint))
+        if breaker is None:
+            breaker = self.breakers[(region, endpoint)] = CircuitBreaker()
+        return breaker
+
+    def _transition(self, region, endpoint, breaker, state):
+        print(f"Circuit breaker {region}/{endpoint}: {breaker.state} -> {state}")
+        metrics.inc("lolbot_circuit_transitions_total", region=region, endpoint=endpoint, state=state)
+        breaker.state = state
+
+    def is_open(self, region, endpoint):
+        """Whether a call would be rejected right now."""
+        breaker = self.breakers.get((region, endpoint))
+        return breaker is not None and breaker.state != "closed" and time.monotonic() < breaker.retry_at
+
+    def before_call(self, region, endpoint):
+        """Raise CircuitOpenError unless the call may go out. After the cooldown one probe goes out at a time."""
+        breaker = self._breaker(region, endpoint)
+        if breaker.state == "closed":
+            return
+        now = time.monotonic()
+        if now < breaker.retry_at:
+            raise CircuitOpenError(f"Circuit breaker for {region}/{endpoint} is {breaker.state}")
+        if breaker.state == "open":
+            self._transition(region, endpoint, breaker, "half_open")
+        # A probe that never reports back (e.g. cancelled) doesn't keep the breaker half-open forever
+        breaker.retry_at = now + self.cooldown
+
+    def success(self, region, endpoint):
+        breaker = self._breaker(region, endpoint)
+        breaker.failures = 0
+        if breaker.state != "closed":
+            self._transition(region, endpoint, breaker, "closed")
+
+    def failure(self, region, endpoint):
+        breaker = self._breaker(region, endpoint)
+        breaker.failures += 1
+        if breaker.state == "half_open" or (breaker.state == "closed" and breaker.failures >= self.failure_threshold):
+            self._transition(region, endpoint, breaker, "open")
+            breaker.retry_at = time.monotonic() + self.cooldown
+
+    def snapshot(self):
+        return {f"{region}/{endpoint}": breaker.state for (region, endpoint), breaker in self.breakers.items()}
+
+circuit_breakers = CircuitBreakers(BREAKER_FAILURES, BREAKER_COOLDOWN)
+
+# Poll scheduling
+class PollScheduler:
+    """Priority queue of accounts ordered by their next poll time.
+
+    Accounts with a new match or rank change go back to the minimum interval, idle ones
+    double their interval up to the maximum.
+    """
+
+    def __init__(self, min_interval, max_interval):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.heap = []       # (due_at, discord_id, riot_id), may hold stale entries
+        self.due_at = {}     # (discord_id, riot_id) -> due_at of the live heap entry
+        self.intervals = {}  # (discord_id, riot_id) -> current interval
+
+    def __len__(self):
+        return len(self.due_at)
+
+    def schedule(self, key, delay=0):
+        due_at = time.monotonic() + delay
+        self.due_at[key] = due_at
+        self.intervals.setdefault(key, self.min_interval)
+        heapq.heappush(self.heap, (due_at, *key))
+
+    def remove(self, key):
+        self.due_at.pop(key, None)
+        self.intervals.pop(key, None)
+
+    def pop_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due_at, discord_id, riot_id = heapq.heappop(self.heap)
+            key = (discord_id, riot_id)
+            if self.due_at.get(key) == due_at:  # Skip entries from removed or rescheduled accounts
+                del self.due_at[key]
+                due.append(key)
+        return due
+
+    def reschedule(self, key, active):
+        if active:
+            interval = self.min_interval
+        else:
+            interval = min(self.intervals.get(key, self.min_interval) * 2, self.max_interval)
+        self.intervals[key] = interval
+        self.schedule(key, interval)
+
+poll_scheduler = PollScheduler(POLL_MIN_INTERVAL, POLL_MAX_INTERVAL)
+poll_stats = {"due": 0, "skipped": 0, "active": 0, "duration": 0.0}
+
 # Loading and saving
+
+class JsonStore:
+    """The original player_data.json file. It is rewritten as a whole, through a temp file and rename."""
+
+    def __init__(self, path):
+        self.path = path
+        self.accounts = {}  # (discord_id, riot_id) -> account data, mirrors the file
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            try:
+                with open(self.path, "r") as f:
+                    loaded_data = json.load(f)
+            except FileNotFoundError:
+                loaded_data = {}
+
+            # Convert loaded data to dictionary with integer keys
+            data = {int(k): v for k, v in loaded_data.items()}
+            self.accounts = {
+                (discord_id, riot_id): account
+                for discord_id, riot_id_data in data.items()
+                for riot_id, account in riot_id_data.items()
+            }
+            return data
+
+    def save(self, accounts, removed):
+        """Write the file and return the number of bytes written."""
+        with self.lock:
+            for key in removed:
+                self.accounts.pop(key, None)
+            self.accounts.update(accounts)
+
+            data = {}
+            for (discord_id, riot_id), account in self.accounts.items():
+                data.setdefault(discord_id, {})[riot_id] = account
+            payload = json.dumps(data, indent=4).encode()
+
+            # A crash mid-write leaves the temp file behind, never a half written database
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return len(payload)
+
+class SqliteStore:
+    """Player data in SQLite (WAL mode), one row per account, league entry and streak.
+
+    Methods block, so they run through asyncio.to_thread. The first load imports an
+    existing player_data.json once.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS accounts (
+            discord_id INTEGER NOT NULL,
+            riot_id TEXT NOT NULL,
+            puuid TEXT NOT NULL,
+            summoner_id TEXT,
+            last_match_id TEXT,
+            last_queue_type TEXT,
+            PRIMARY KEY (discord_id, riot_id)
+        );
+        CREATE TABLE IF NOT EXISTS league_entries (
+            discord_id INTEGER NOT NULL,
+            riot_id TEXT NOT NULL,
+            queue_type TEXT NOT NULL,
+            tier TEXT NOT NULL,
+            rank TEXT NOT NULL,
+            league_points INTEGER NOT NULL,
+            PRIMARY KEY (discord_id, riot_id, queue_type)
+        );
+        CREATE TABLE IF NOT EXISTS streaks (
+            discord_id INTEGER NOT NULL,
+            riot_id TEXT NOT NULL,
+            streak_type TEXT NOT NULL,
+            wins INTEGER NOT NULL,
+            losses INTEGER NOT NULL,
+            PRIMARY KEY (discord_id, riot_id, streak_type)
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path, json_path=None):
+        self.path = path
+        self.json_path = json_path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(self.SCHEMA)
+        return self.conn
+
+    def load(self):
+        with self.lock:
+            conn = self.connect()
+            self._import_json(conn)
+
+            data = {}
+            for discord_id, riot_id, puuid, summoner_id, last_match_id, last_queue_type in conn.execute(
+                "SELECT discord_id, riot_id, puuid, summoner_id, last_match_id, last_queue_type FROM accounts ORDER BY rowid"
+            ):
+                data.setdefault(discord_id, {})[riot_id] = {
+                    "puuid": puuid,
+                    "summoner_id": summoner_id,
+                    "league_entries": {},
+                    "last_match_id": last_match_id,
+                    "streaks": {},
+                    "last_queue_type": last_queue_type
+                }
+            for discord_id, riot_id, queue_type, tier, rank, league_points in conn.execute(
+                "SELECT discord_id, riot_id, queue_type, tier, rank, league_points FROM league_entries"
+            ):
+                account = data.get(discord_id, {}).get(riot_id)
+                if account is not None:
+                    account["league_entries"][queue_type] = {"tier": tier, "rank": rank, "leaguePoints": league_points}
+            for discord_id, riot_id, streak_type, wins, losses in conn.execute(
+                "SELECT discord_id, riot_id, streak_type, wins, losses FROM streaks"
+            ):
+                account = data.get(discord_id, {}).get(riot_id)
+                if account is not None:
+                    account["streaks"][streak_type] = {"wins": wins, "losses": losses}
+            return data
+
+    def save(self, accounts, removed):
+        """Upsert the given accounts and delete the removed ones in a single transaction.
+
+        Returns the size of the row values written, SQLite doesn't report the pages it wrote.
+        """
+        with self.lock:
+            conn = self.connect()
+            with conn:
+                for key in removed:
+                    self._delete(conn, key)
+                return sum(self._upsert(conn, key, account) for key, account in accounts.items())
+
+    def _delete(self, conn, key):
+        for table in ("accounts", "league_entries", "streaks"):
+            conn.execute(f"DELETE FROM {table} WHERE discord_id = ? AND riot_id = ?", key)
+
+    def _upsert(self, conn, key, account):
+        discord_id, riot_id = key
+        account_row = (discord_id, riot_id, account["puuid"], account["summoner_id"], account["last_match_id"], account["last_queue_type"])
+        league_rows = [
+            (discord_id, riot_id, queue_type, entry["tier"], entry["rank"], entry["leaguePoints"])
+            for queue_type, entry in (account["league_entries"] or {}).items()
+        ]
+        streak_rows = [
+            (discord_id, riot_id, streak_type, streak["wins"], streak["losses"])
+            for streak_type, streak in account["streaks"].items()
+        ]
+        conn.execute(
+            """INSERT INTO accounts (discord_id, riot_id, puuid, summoner_id, last_match_id, last_queue_type)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (discord_id, riot_id) DO UPDATE SET
+                   puuid = excluded.puuid,
+                   summoner_id = excluded.summoner_id,
+                   last_match_id = excluded.last_match_id,
+                   last_queue_type = excluded.last_queue_type""",
+            account_row
+        )
+        conn.executemany(
+            """INSERT INTO league_entries (discord_id, riot_id, queue_type, tier, rank, league_points)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (discord_id, riot_id, queue_type) DO UPDATE SET
+                   tier = excluded.tier,
+                   rank = excluded.rank,
+                   league_points = excluded.league_points""",
+            league_rows
+        )
+        conn.executemany(
+            """INSERT INTO streaks (discord_id, riot_id, streak_type, wins, losses)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (discord_id, riot_id, streak_type) DO UPDATE SET
+                   wins = excluded.wins,
+                   losses = excluded.losses""",
+            streak_rows
+        )
+        return sum(len(str(value)) for row in [account_row, *league_rows, *streak_rows] for value in row)
+
+    def _import_json(self, conn):
+        if not self.json_path or conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+            return
+        try:
+            with open(self.json_path, "r") as f:
+                loaded_data = json.load(f)
+        except FileNotFoundError:
+            loaded_data = {}
+
+        with conn:
+            for discord_id, riot_id_data in loaded_data.items():
+                for riot_id, account in riot_id_data.items():
+                    self._upsert(conn, (int(discord_id), riot_id), account)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_imported', ?)", (self.json_path,))
+        if loaded_data:
+            print(f"Imported {sum(len(v) for v in loaded_data.values())} account(s) from {self.json_path}")
+
+if STORAGE_BACKEND == "json":
+    player_store = JsonStore(DATABASE_FILE)
+else:
+    player_store = SqliteStore(SQLITE_DATABASE_FILE, json_path=DATABASE_FILE)
+dirty_accounts = set()    # Changed since the last save
+removed_accounts = set()  # Unregistered since the last save
+save_lock = asyncio.Lock()
+save_stats = {"flushes": 0, "accounts_written": 0, "bytes_written": 0, "last_seconds": 0.0, "total_seconds": 0.0}
+
+def mark_dirty(discord_id, riot_id):
+    dirty_accounts.add((discord_id, riot_id))
+
 async def load_player_data():
     global player_data
-    try:
-        with open(DATABASE_FILE, "r") as f:
-            loaded_data = json.load(f)
+    loaded_data = await asyncio.to_thread(player_store.load)
+    player_data = {
+        discord_id: {riot_id: Account.from_dict(data) for riot_id, data in riot_id_data.items()}
+        for discord_id, riot_id_data in loaded_data.items()
+    }
+    rank_index.rebuild(player_data)
 
-            # Convert loaded data to dictionary with integer keys
-            player_data = {int(k): v for k, v in loaded_data.items()}  
-            
-    except FileNotFoundError:
-        player_data = {}
-        await save_player_data()
+    games = await asyncio.to_thread(match_history.load)
+    for discord_id, riot_id_data in player_data.items():
+        for riot_id, data in riot_id_data.items():
+            if data.puuid in match_history.backfilled and recompute_streaks(data):
+                mark_dirty(discord_id, riot_id)
+    print(f"Loaded {games} logged games of {len(match_history.histories)} accounts")
+
+    # Spread the first polls over one interval instead of polling everyone at once
+    for discord_id, riot_id_data in player_data.items():
+        for riot_id in riot_id_data:
+            poll_scheduler.schedule((discord_id, riot_id), random.uniform(0, POLL_MIN_INTERVAL))
 
 async def save_player_data():
-    with open(DATABASE_FILE, "w") as f:
-        json.dump(player_data, f, indent=4)
+    """Write the accounts changed since the last save, if there are any."""
+    await save_match_history()
+    async with save_lock:
+        if not dirty_accounts and not removed_accounts:
+            return
+        keys = dirty_accounts.copy()
+        removed = removed_accounts.copy()
+        dirty_accounts.clear()
+        removed_accounts.clear()
+
+        # Copy on the event loop, the write itself runs in a worker thread while polling goes on
+        accounts = {}
+        for discord_id, riot_id in keys:
+            data = player_data.get(discord_id, {}).get(riot_id)
+            if data is not None:
+                accounts[(discord_id, riot_id)] = data.to_dict()
+
+        started = time.perf_counter()
+        try:
+            bytes_written = await asyncio.to_thread(player_store.save, accounts, removed)
+        except Exception:
+            # Keep everything pending so the next flush writes it
+            dirty_accounts.update(keys)
+            removed_accounts.update(removed)
+            raise
+        duration = time.perf_counter() - started
+        metrics.observe("lolbot_save_seconds", duration)
+
+        save_stats["flushes"] += 1
+        save_stats["accounts_written"] += len(accounts)
+        save_stats["bytes_written"] += bytes_written
+        save_stats["last_seconds"] = duration
+        save_stats["total_seconds"] += duration
+
+@tasks.loop(seconds=SAVE_INTERVAL)
+async def player_data_flusher():
+    try:
+        await save_player_data()
+    except Exception as e:
+        print(f"Error in player_data_flusher: {e}")
 
 # Getters
 async def get_puuid(riot_id):
@@ -78,11 +1125,11 @@ async def get_puuid(riot_id):
         gameName, tagLine = riot_id.split('#')
     except ValueError:
         return None
-    url = f"https://{region}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{gameName}/{tagLine}?api_key={api_key}"
+    url = f"{riot_api_base(region)}/riot/account/v1/accounts/by-riot-id/{gameName}/{tagLine}?api_key={api_key}"
 
     try:
-        response = get_with_retry(url)  
-    except requests.exceptions.RequestException as e:
+        response = await get_with_retry(url, region, "account-v1.by-riot-id")
+    except aiohttp.ClientError as e:
         print(f"Error fetching PUUID after retries: {e}")
         return None  # Return None on error after retries
 
@@ -101,11 +1148,11 @@ async def get_puuid(riot_id):
 
 async def get_league_entries(summoner_id):
     region = API_REGIONS["league"]
-    url = f"https://{region}.api.riotgames.com/lol/league/v4/entries/by-summoner/{summoner_id}?api_key={api_key}"
+    url = f"{riot_api_base(region)}/lol/league/v4/entries/by-summoner/{summoner_id}?api_key={api_key}"
 
     try:
-        response = get_with_retry(url)
-    except requests.exceptions.RequestException as e:
+        response = await get_with_retry(url, region, "league-v4.entries-by-summoner")
+    except aiohttp.ClientError as e:
         print(f"Error fetching league entries after retries: {e}")  # Log after retry failures
         return None 
 
@@ -119,18 +1166,13 @@ async def get_league_entries(summoner_id):
 
         ranks = {}
         for entry in entries:
-            if entry['queueType'] == 'RANKED_SOLO_5x5':
-                ranks['solo_duo'] = {
-                    "tier": entry['tier'],
-                    "rank": entry['rank'],
-                    "leaguePoints": entry['leaguePoints']
-                }
-            elif entry['queueType'] == 'RANKED_FLEX_SR':
-                ranks['flex'] = {
-                    "tier": entry['tier'],
-                    "rank": entry['rank'],
-                    "leaguePoints": entry['leaguePoints']
-                }
+            queue_type = RIOT_QUEUE_TYPES.get(entry.get('queueType'))
+            if queue_type is None:
+                continue
+            try:
+                ranks[queue_type] = LeagueEntry.from_dict(entry)
+            except ValueError as e:
+                print(f"Error fetching league entries: {e}")
         return ranks
     elif response.status_code == 404:
         return None  # Summoner not found
@@ -138,39 +1180,64 @@ async def get_league_entries(summoner_id):
         print(f"Error fetching league entries: {response.status_code} - {response.text}")
         return None
 
-async def get_last_match_id(puuid):
+async def get_match_ids(puuid, start=0, count=1, start_time=None):
     region = API_REGIONS["match"]
-    url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids?start=0&count=1&api_key={api_key}"
+    url = f"{riot_api_base(region)}/lol/match/v5/matches/by-puuid/{puuid}/ids?start={start}&count={count}&api_key={api_key}"
+    if start_time is not None:
+        url += f"&startTime={start_time}"
 
     try:
-        response = get_with_retry(url)
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching last match ID after retries: {e}")  # Log error after retries
+        response = await get_with_retry(url, region, "match-v5.ids-by-puuid")
+    except aiohttp.ClientError as e:
+        print(f"Error fetching match IDs after retries: {e}")  # Log error after retries
         return None  # Return None on error after retries
 
     if response.status_code == 200:
         match_ids = response.json()
 
         # Data validation
-        if isinstance(match_ids, list) and match_ids:  # Check if response is a list and not empty
-            return match_ids[0]
+        if isinstance(match_ids, list):
+            return match_ids
         else:
-            print("Error fetching last match ID: Unexpected response format -", match_ids)
+            print("Error fetching match IDs: Unexpected response format -", match_ids)
             return None
 
     elif response.status_code == 404:
-        return None  # No matches found (new account or no recent matches)
+        return []  # No matches found (new account or no recent matches)
     else:
-        print(f"Error fetching last match ID: {response.status_code} - {response.text}")
+        print(f"Error fetching match IDs: {response.status_code} - {response.text}")
         return None
 
+async def get_last_match_id(puuid):
+    match_ids = await get_match_ids(puuid, count=1)
+    return match_ids[0] if match_ids else None
+
+async def get_new_match_ids(puuid, last_match_id, start_time):
+    """Match IDs played after last_match_id (and after start_time), oldest first.
+
+    Pages back until the stored match shows up, so games played between two polls
+    or while the bot was down aren't skipped. Returns None when Riot couldn't be reached.
+    """
+    new_match_ids = []
+    for page in range(MATCH_CATCHUP_MAX_PAGES):
+        match_ids = await get_match_ids(puuid, page * MATCH_PAGE_SIZE, MATCH_PAGE_SIZE, start_time)
+        if match_ids is None:
+            return None
+        for match_id in match_ids:
+            if match_id == last_match_id:
+                return new_match_ids[::-1]
+            new_match_ids.append(match_id)
+        if len(match_ids) < MATCH_PAGE_SIZE:
+            break
+    return new_match_ids[::-1]
+
 async def get_summoner_id(puuid):
     region = API_REGIONS["summoner"]
-    url = f"https://{region}.api.riotgames.com/lol/summoner/v4/summoners/by-puuid/{puuid}?api_key={api_key}"
+    url = f"{riot_api_base(region)}/lol/summoner/v4/summoners/by-puuid/{puuid}?api_key={api_key}"
 
     try:
-        response = get_with_retry(url)
-    except requests.exceptions.RequestException as e:
+        response = await get_with_retry(url, region, "summoner-v4.by-puuid")
+    except aiohttp.ClientError as e:
         print(f"Error fetching summoner ID after retries: {e}")
         return None  # Return None on error after retries
 
@@ -191,11 +1258,11 @@ async def get_summoner_id(puuid):
         return None
 
 async def get_latest_version():
-    url = "https://ddragon.leagueoflegends.com/api/versions.json"
+    url = f"{DDRAGON_URL}/api/versions.json"
 
     try:
-        response = get_with_retry(url)
-    except requests.exceptions.RequestException as e:
+        response = await get_with_retry(url)
+    except aiohttp.ClientError as e:
         print(f"Error fetching latest version after retries: {e}")
         return None
 
@@ -214,19 +1281,12 @@ async def get_latest_version():
         print(f"Error fetching latest version: {response.status_code} - {response.text}")
         return None
 
-async def get_champion_id(champion_name):
-    latest_version = await get_latest_version()
-    
-    # Check if latest_version was obtained successfully
-    if not latest_version:
-        print("Error fetching latest version, cannot get champion ID.")
-        return None
-
-    url = f"http://ddragon.leagueoflegends.com/cdn/{latest_version}/data/en_US/champion.json"
+async def get_champion_data(version):
+    url = f"{DDRAGON_URL}/cdn/{version}/data/en_US/champion.json"
 
     try:
-        response = get_with_retry(url)
-    except requests.exceptions.RequestException as e:
+        response = await get_with_retry(url)
+    except aiohttp.ClientError as e:
         print(f"Error fetching champion data after retries: {e}")
         return None
 
@@ -238,28 +1298,742 @@ async def get_champion_id(champion_name):
             print(f"Error fetching champion data: Unexpected response format - {champion_data}")
             return None
 
-        for champ_key, champ_info in champion_data.items():
-            if champ_info["name"].lower() == champion_name.lower():
-                return champ_info["key"]
-        
-        # Champion not found
-        print(f"Error fetching champion ID: Champion '{champion_name}' not found.")  # Log champion not found
-        return None 
+        return champion_data
     else:
         print(f"Error fetching champion data: {response.status_code} - {response.text}")
         return None
 
+async def get_champion_id(champion_name):
+    if not ddragon_cache.index:
+        await ddragon_cache.refresh()
+
+    champion_id = ddragon_cache.lookup(champion_name)
+    if champion_id is None:
+        # Champion not found
+        print(f"Error fetching champion ID: Champion '{champion_name}' not found.")  # Log champion not found
+    return champion_id
+
+async def get_champion_mastery(puuid, champion_id):
+    """(level, points) for one champion, None if the account never played it. Raises on other errors."""
+    region = API_REGIONS["summoner"]
+    url = f"{riot_api_base(region)}/lol/champion-mastery/v4/champion-masteries/by-puuid/{puuid}/by-champion/{champion_id}?api_key={api_key}"
+    try:
+        response = await get_with_retry(url, region, "champion-mastery-v4.by-champion")
+    except HTTPStatusError as e:
+        if e.response.status_code == 404:
+            return None
+        raise
+    mastery_data = response.json()
+    return mastery_data["championLevel"], mastery_data["championPoints"]
+
+async def get_all_champion_masteries(puuid):
+    """{champion key: (level, points)} for every champion the account has played. Raises on errors."""
+    region = API_REGIONS["summoner"]
+    url = f"{riot_api_base(region)}/lol/champion-mastery/v4/champion-masteries/by-puuid/{puuid}?api_key={api_key}"
+    response = await get_with_retry(url, region, "champion-mastery-v4.by-puuid")
+    return {
+        str(mastery_data["championId"]): (mastery_data["championLevel"], mastery_data["championPoints"])
+        for mastery_data in response.json()
+    }
+
+# Data Dragon
+def normalize_champion_name(name):
+    """Lowercase and drop spaces and punctuation, so "Kai'Sa", "kaisa" and "KAI SA" all match."""
+    return "".join(c for c in name.lower() if c.isalnum())
+
+class DataDragonCache:
+    """Data Dragon version and champion list, kept on disk so champion lookups need no network calls."""
+
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.champions = {}  # champion key ("145") -> display name ("Kai'Sa")
+        self.index = {}      # normalized name or id -> champion key
+        self.sorted_names = []  # (normalized name, display name), for autocomplete
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                cached = json.load(f)
+            self.set_champions(cached["version"], cached["champions"])
+        except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+            print(f"Data Dragon cache not loaded: {e!r}")
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": self.version, "champions": self.champions}, f)
+        os.replace(tmp_path, self.path)
+
+    def set_champions(self, version, champions):
+        """champions maps champion key to {"id": "KSante", "name": "K'Sante"}."""
+        index = {}
+        for key, champ in champions.items():
+            index[normalize_champion_name(champ["id"])] = key
+            index[normalize_champion_name(champ["name"])] = key
+        self.version = version
+        self.champions = champions
+        self.index = index
+        self.sorted_names = sorted((normalize_champion_name(c["name"]), c["name"]) for c in champions.values())
+
+    def lookup(self, champion_name):
+        return self.index.get(normalize_champion_name(champion_name))
+
+    def search(self, current, limit=25):
+        """Champion names for autocomplete, prefix matches before substring matches."""
+        needle = normalize_champion_name(current)
+        prefix = [name for norm, name in self.sorted_names if norm.startswith(needle)]
+        if len(prefix) >= limit:
+            return prefix[:limit]
+        rest = [name for norm, name in self.sorted_names if needle in norm and not norm.startswith(needle)]
+        return (prefix + rest)[:limit]
+
+    async def refresh(self):
+        """Download champion.json again, but only when versions.json has a new patch."""
+        latest_version = await get_latest_version()
+        
+        # Check if latest_version was obtained successfully
+        if not latest_version:
+            print("Error fetching latest version, keeping cached champion data.")
+            return
+        if latest_version == self.version and self.index:
+            return
+
+        champion_data = await get_champion_data(latest_version)
+        if champion_data is None:
+            return
+        champions = {
+            champ_info["key"]: {"id": champ_info["id"], "name": champ_info["name"]}
+            for champ_info in champion_data.values()
+        }
+        self.set_champions(latest_version, champions)
+        await asyncio.to_thread(self.save)
+        print(f"Data Dragon cache updated to {latest_version} ({len(champions)} champions)")
+
+ddragon_cache = DataDragonCache(DDRAGON_CACHE_FILE)
+
+@tasks.loop(hours=1)
+async def ddragon_refresher():
+    try:
+        with request_priority(LANE_BACKGROUND):
+            await ddragon_cache.refresh()
+    except Exception as e:
+        print(f"Error in ddragon_refresher: {e}")
+
+# Match cache
+class CompactMatch:
+    """The parts of a match-v5 payload we use: the queue, when it ended and who won."""
+    __slots__ = ("queue_id", "game_end", "puuids", "wins", "size")
+
+    def __init__(self, queue_id, game_end, puuids, wins):
+        self.queue_id = queue_id
+        self.game_end = game_end  # Epoch milliseconds
+        self.puuids = puuids      # Tuple in participant order
+        self.wins = wins          # Bit i set when participant i won
+        self.size = sys.getsizeof(self) + sys.getsizeof(puuids) + sum(sys.getsizeof(p) for p in puuids)
+
+    @classmethod
+    def from_match_data(cls, match_data):
+        info = match_data["info"]
+        participants = info["participants"]
+        wins = 0
+        for i, participant in enumerate(participants):
+            if participant["win"]:
+                wins |= 1 << i
+        return cls(
+            info["queueId"],
+            info.get("gameEndTimestamp") or info.get("gameCreation") or 0,
+            tuple(participant["puuid"] for participant in participants),
+            wins
+        )
+
+    def result(self, puuid):
+        """True for a win, False for a loss, None when the player wasn't in the match."""
+        try:
+            i = self.puuids.index(puuid)
+        except ValueError:
+            return None
+        return bool(self.wins >> i & 1)
+
+class MatchDiskCache:
+    """Optional on-disk tier for CompactMatch, in its own SQLite file. Methods block."""
+
+    def __init__(self, path, max_rows):
+        self.path = path
+        self.max_rows = max_rows
+        self.conn = None
+        self.lock = threading.Lock()
+        self.writes = 0
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS matches (
+                    match_id TEXT PRIMARY KEY,
+                    queue_id INTEGER NOT NULL,
+                    game_end INTEGER NOT NULL,
+                    puuids TEXT NOT NULL,
+                    wins INTEGER NOT NULL
+                )"""
+            )
+        return self.conn
+
+    def get(self, match_id):
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT queue_id, game_end, puuids, wins FROM matches WHERE match_id = ?", (match_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        queue_id, game_end, puuids, wins = row
+        return CompactMatch(queue_id, game_end, tuple(puuids.split(",")), wins)
+
+    def put(self, match_id, match):
+        with self.lock:
+            conn = self.connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO matches (match_id, queue_id, game_end, puuids, wins) VALUES (?, ?, ?, ?, ?)",
+                    (match_id, match.queue_id, match.game_end, ",".join(match.puuids), match.wins)
+                )
+                self.writes += 1
+                if self.writes % 1000 == 0:
+                    # Drop the oldest rows once in a while instead of on every insert
+                    conn.execute(
+                        "DELETE FROM matches WHERE rowid <= (SELECT MAX(rowid) FROM matches) - ?", (self.max_rows,)
+                    )
+
+class MatchCache:
+    """LRU cache of CompactMatch by match ID, bounded by its approximate size in memory.
+
+    Concurrent lookups of the same match share one in-flight request, so players who
+    queued together cost a single match details call.
+    """
+
+    def __init__(self, max_bytes, disk=None):
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self.entries = OrderedDict()  # match_id -> CompactMatch, least recently used first
+        self.size = 0
+        self.in_flight = {}           # match_id -> task
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def get(self, match_id):
+        match = self.entries.get(match_id)
+        if match is not None:
+            self.entries.move_to_end(match_id)
+            self.hits += 1
+            return match
+
+        task = self.in_flight.get(match_id)
+        if task is None:
+            task = self.in_flight[match_id] = asyncio.create_task(self._load(match_id))
+            task.add_done_callback(lambda _: self.in_flight.pop(match_id, None))
+        # Shielded, a cancelled caller must not cancel the fetch for everyone else waiting on it
+        return await asyncio.shield(task)
+
+    async def _load(self, match_id):
+        if self.disk:
+            match = await asyncio.to_thread(self.disk.get, match_id)
+            if match is not None:
+                self.disk_hits += 1
+                self._put(match_id, match)
+                return match
+
+        self.misses += 1
+        match_data = await get_match_details(match_id)
+        if match_data is None:
+            return None  # Failures aren't cached, the next poll tries again
+        match = CompactMatch.from_match_data(match_data)
+        self._put(match_id, match)
+        if self.disk:
+            await asyncio.to_thread(self.disk.put, match_id, match)
+        return match
+
+    def _put(self, match_id, match):
+        old = self.entries.pop(match_id, None)
+        if old is not None:
+            self.size -= old.size
+        self.entries[match_id] = match
+        self.size += match.size
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+
+match_cache = MatchCache(
+    MATCH_CACHE_MAX_BYTES,
+    MatchDiskCache(MATCH_CACHE_FILE, MATCH_DISK_CACHE_MAX_ROWS) if MATCH_CACHE_FILE else None
+)
+
+# Match history
+class MatchHistory:
+    """One account's most recent games per streak type, oldest first. Wins are 1/0 in a bytearray."""
+    __slots__ = ("queues",)
+
+    def __init__(self):
+        self.queues = {}  # StreakType -> (match ids, array("q") of game end times, bytearray of wins)
+
+    def add(self, match_id, streak_type, game_end, win, limit=MATCH_HISTORY_GAMES):
+        """Insert one game in time order, return False if it is already known or too old to keep."""
+        match_ids, game_ends, wins = self.queues.setdefault(streak_type, ([], array("q"), bytearray()))
+        if match_id in match_ids:
+            return False
+        position = bisect.bisect_right(game_ends, game_end)
+        if position == 0 and len(game_ends) >= limit:
+            return False
+        match_ids.insert(position, match_id)
+        game_ends.insert(position, game_end)
+        wins.insert(position, 1 if win else 0)
+        if len(game_ends) > limit:
+            del match_ids[0], game_ends[0], wins[0]
+        return True
+
+    def streak(self, streak_type):
+        """The current streak, counted back from the latest game."""
+        streak = Streak()
+        queue = self.queues.get(streak_type)
+        if queue:
+            wins = queue[2]
+            last = wins[-1]
+            count = 1
+            while count < len(wins) and wins[-count - 1] == last:
+                count += 1
+            if last:
+                streak.wins = count
+            else:
+                streak.losses = count
+        return streak
+
+    def record(self, streak_type, count):
+        """(games, wins) over the last count games of a streak type."""
+        queue = self.queues.get(streak_type)
+        if not queue:
+            return 0, 0
+        recent = queue[2][-count:]
+        return len(recent), sum(recent)
+
+class MatchHistoryLog:
+    """Match history per puuid, backed by an append-only SQLite table. Blocking methods run through asyncio.to_thread."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            puuid TEXT NOT NULL,
+            match_id TEXT NOT NULL,
+            queue_id INTEGER NOT NULL,
+            win INTEGER NOT NULL,
+            game_end INTEGER NOT NULL,
+            PRIMARY KEY (puuid, match_id)
+        );
+        CREATE INDEX IF NOT EXISTS games_by_queue ON games (puuid, queue_id, game_end);
+        CREATE TABLE IF NOT EXISTS backfilled (
+            puuid TEXT PRIMARY KEY
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.histories = {}  # puuid -> MatchHistory
+        self.backfilled = set()
+        self.pending = []    # games not written yet
+        self.pending_backfilled = []
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        return conn
+
+    def load(self):
+        """Read the latest games per account and queue. Runs before polling starts."""
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                """SELECT puuid, match_id, queue_id, win, game_end FROM (
+                    SELECT *, ROW_NUMBER() OVER (PARTITION BY puuid, queue_id ORDER BY game_end DESC) AS n FROM games
+                ) WHERE n <= ? ORDER BY game_end""",
+                (MATCH_HISTORY_GAMES,)
+            ).fetchall()
+            backfilled = {puuid for (puuid,) in conn.execute("SELECT puuid FROM backfilled")}
+        finally:
+            conn.close()
+
+        histories = {}
+        for puuid, match_id, queue_id, win, game_end in rows:
+            streak_type = QUEUE_STREAK_TYPES.get(queue_id)
+            if streak_type:
+                histories.setdefault(puuid, MatchHistory()).add(match_id, streak_type, game_end, win)
+        self.histories = histories
+        self.backfilled = backfilled
+        return len(rows)
+
+    def add(self, puuid, match_id, match):
+        """Log one game of an account. Returns whether it is new to the in-memory history.
+
+        Every game goes to the table, known ones are ignored there, older ones are only kept on disk.
+        """
+        streak_type = QUEUE_STREAK_TYPES.get(match.queue_id)
+        win = match.result(puuid)
+        if win is None:
+            return False
+        self.pending.append((puuid, match_id, match.queue_id, int(win), match.game_end))
+        if not streak_type:
+            return False
+        return self.histories.setdefault(puuid, MatchHistory()).add(match_id, streak_type, match.game_end, win)
+
+    def mark_backfilled(self, puuid):
+        self.backfilled.add(puuid)
+        self.pending_backfilled.append((puuid,))
+
+    def take_pending(self):
+        games, backfilled = self.pending, self.pending_backfilled
+        self.pending, self.pending_backfilled = [], []
+        return games, backfilled
+
+    def write(self, games, backfilled):
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO games (puuid, match_id, queue_id, win, game_end) VALUES (?, ?, ?, ?, ?)", games
+                )
+                conn.executemany("INSERT OR IGNORE INTO backfilled (puuid) VALUES (?)", backfilled)
+        finally:
+            conn.close()
+
+match_history = MatchHistoryLog(MATCH_HISTORY_FILE)
+
+async def save_match_history():
+    games, backfilled = match_history.take_pending()
+    if not games and not backfilled:
+        return
+    try:
+        await asyncio.to_thread(match_history.write, games, backfilled)
+    except Exception:
+        # Keep them for the next flush
+        match_history.pending[:0] = games
+        match_history.pending_backfilled[:0] = backfilled
+        raise
+
+def recompute_streaks(account):
+    """Derive the account's streaks from its match history, return whether any changed."""
+    history = match_history.histories.get(account.puuid)
+    if history is None:
+        return False
+    changed = False
+    for streak_type in history.queues:
+        streak = history.streak(streak_type)
+        old = account.streaks[streak_type]
+        if (old.wins, old.losses) != (streak.wins, streak.losses):
+            account.streaks[streak_type] = streak
+            changed = True
+    return changed
+
+def backfill_budget():
+    return rate_limiter.free_share(API_REGIONS["match"]) >= MATCH_HISTORY_BACKFILL_RESERVE
+
+async def backfill_match(match_id, semaphore):
+    async with semaphore:
+        if not backfill_budget():
+            return None
+        return await match_cache.get(match_id)
+
+async def backfill_account(discord_id, riot_id, data, semaphore):
+    """Log the account's last MATCH_HISTORY_GAMES games. Returns False if it has to be retried later."""
+    match_ids = await get_match_ids(data.puuid, 0, min(MATCH_HISTORY_GAMES, 100))
+    if match_ids is None:
+        return False
+    history = match_history.histories.get(data.puuid)
+    known = {match_id for queue in history.queues.values() for match_id in queue[0]} if history else set()
+    missing = [match_id for match_id in match_ids if match_id not in known]
+    matches = await asyncio.gather(*(backfill_match(match_id, semaphore) for match_id in missing))
+    for match_id, match in zip(missing, matches):
+        if match:
+            match_history.add(data.puuid, match_id, match)
+    if not all(matches):
+        return False
+
+    match_history.mark_backfilled(data.puuid)
+    if recompute_streaks(data):
+        mark_dirty(discord_id, riot_id)
+    return True
+
+@tasks.loop(minutes=5)
+async def match_history_backfiller():
+    """Fill in the history of accounts that were never backfilled, using only spare rate limit."""
+    semaphore = asyncio.Semaphore(MATCH_HISTORY_BACKFILL_CONCURRENCY)
+    seen = set()
+    done = 0
+    try:
+        for discord_id, riot_id_data in list(player_data.items()):
+            for riot_id, data in list(riot_id_data.items()):
+                if data.puuid in match_history.backfilled or data.puuid in seen:
+                    continue
+                seen.add(data.puuid)
+                if not backfill_budget():
+                    return
+                with request_priority(LANE_BACKGROUND):
+                    backfilled = await backfill_account(discord_id, riot_id, data, semaphore)
+                if backfilled:
+                    done += 1
+    except Exception as e:
+        print(f"Error in match_history_backfiller: {e}")
+    finally:
+        if done:
+            print(f"Backfilled match history of {done} account(s)")
+
+# Champion mastery
+class MasteryCache:
+    """Champion mastery per account for a short TTL, either one champion at a time or all of them (bulk)."""
+
+    def __init__(self, ttl, bulk):
+        self.ttl = ttl
+        self.bulk = bulk
+        self.champions = {}  # (puuid, champion key) -> ((level, points) or None, expires_at)
+        self.accounts = {}   # puuid -> ({champion key: (level, points)}, expires_at)
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, puuid, champion_id):
+        """(level, points) or None if the account never played the champion."""
+        now = time.monotonic()
+        cached = self.accounts.get(puuid)
+        if cached is not None and cached[1] > now:
+            self.hits += 1
+            return cached[0].get(champion_id)
+        if self.bulk:
+            return (await self.get_all(puuid)).get(champion_id)
+
+        cached = self.champions.get((puuid, champion_id))
+        if cached is not None and cached[1] > now:
+            self.hits += 1
+            return cached[0]
+        self.misses += 1
+        mastery = await get_champion_mastery(puuid, champion_id)
+        self._prune(self.champions, now)
+        self.champions[(puuid, champion_id)] = (mastery, now + self.ttl)
+        return mastery
+
+    async def get_all(self, puuid):
+        now = time.monotonic()
+        cached = self.accounts.get(puuid)
+        if cached is not None and cached[1] > now:
+            self.hits += 1
+            return cached[0]
+        self.misses += 1
+        masteries = await get_all_champion_masteries(puuid)
+        self._prune(self.accounts, now)
+        self.accounts[puuid] = (masteries, now + self.ttl)
+        return masteries
+
+    def _prune(self, cache, now, max_entries=10000):
+        """Drop expired entries once the cache gets big, so it doesn't grow with every account ever looked up."""
+        if len(cache) >= max_entries:
+            for key in [key for key, (_, expires_at) in cache.items() if expires_at <= now]:
+                del cache[key]
+
+mastery_cache = MasteryCache(MASTERY_CACHE_TTL, MASTERY_BULK)
+
+# Discord users
+class UserResolver:
+    """Discord users by ID: the gateway cache first, then a TTL cache, REST only as a last resort."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.cache = {}  # discord_id -> (user, expires_at)
+        self.stats = {"gateway_hits": 0, "cache_hits": 0, "misses": 0}
+
+    async def resolve(self, discord_id):
+        user = bot.get_user(discord_id)  # Members intent keeps guild members in the gateway cache
+        if user is not None:
+            self.stats["gateway_hits"] += 1
+            return user
+
+        cached = self.cache.get(discord_id)
+        if cached is not None and cached[1] > time.monotonic():
+            self.stats["cache_hits"] += 1
+            return cached[0]
+
+        self.stats["misses"] += 1
+        user = await bot.fetch_user(discord_id)
+        self.cache[discord_id] = (user, time.monotonic() + self.ttl)
+        return user
+
+user_resolver = UserResolver(USER_CACHE_TTL)
+
+# Announcements
+DISCORD_MESSAGE_LIMIT = 2000
+
+def chunk_lines(lines, limit=DISCORD_MESSAGE_LIMIT):
+    """Join lines into as few messages as fit in Discord's length limit."""
+    messages = []
+    current = ""
+    for line in lines:
+        line = line[:limit]
+        if current and len(current) + 1 + len(line) > limit:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
+class NotificationQueue:
+    """Channel announcements, merged per poll cycle and sent by a background task.
+
+    Polling only appends to the pending batch. flush() hands the batch to the sender,
+    which resolves mentions, packs the lines into as few messages as possible and paces
+    the sends so bursts stay under the channel rate limit.
+    """
+
+    def __init__(self, channel_id, min_interval):
+        self.channel_id = channel_id
+        self.min_interval = min_interval
+        self.pending = []  # (discord_id, text) of the current cycle
+        self.batches = None
+        self.queued = 0    # Announcements flushed but not sent yet
+        self.task = None
+        self.last_send = 0.0
+        self.stats = {"announcements": 0, "messages": 0, "failed": 0}
+
+    def announce(self, discord_id, text):
+        """Queue "<mention> <text>" for the channel."""
+        self.pending.append((discord_id, text))
+        self.stats["announcements"] += 1
+
+    def flush(self):
+        if self.pending:
+            if self.batches is None:
+                self.batches = asyncio.Queue()
+            self.batches.put_nowait(self.pending)
+            self.queued += len(self.pending)
+            self.pending = []
+
+    def depth(self):
+        return len(self.pending) + self.queued
+
+    def start(self):
+        if self.batches is None:
+            self.batches = asyncio.Queue()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            batch = await self.batches.get()
+            try:
+                lines = []
+                for discord_id, text in batch:
+                    try:
+                        mention = (await user_resolver.resolve(discord_id)).mention
+                    except discord.HTTPException:
+                        mention = f"<@{discord_id}>"
+                    lines.append(f"{mention} {text}")
+                for message in chunk_lines(lines):
+                    await self.send(message)
+            except Exception as e:
+                print(f"Error sending announcements: {e!r}")
+            finally:
+                self.queued -= len(batch)
+
+    async def send(self, message, max_retries=3):
+        for attempt in range(max_retries):
+            wait = self.last_send + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.last_send = time.monotonic()
+
+            channel = bot.get_channel(self.channel_id)
+            if channel is None:
+                print(f"Error sending announcement: channel {self.channel_id} not found")
+                break
+            try:
+                await channel.send(message)
+                self.stats["messages"] += 1
+                return
+            except discord.HTTPException as e:
+                print(f"Error sending announcement on attempt {attempt + 1}: {e}")
+        self.stats["failed"] += 1
+
+notifications = NotificationQueue(CHANNEL_ID, ANNOUNCE_INTERVAL)
+
+# Leaderboard
+LEADERBOARD_PAGE_SIZE = 10
+
+class RankIndex:
+    """Accounts per queue kept sorted best rank first, so /leaderboard never sorts player_data."""
+
+    def __init__(self):
+        self.entries = {queue_type: [] for queue_type in QueueType}  # QueueType -> sorted [(-score, -LP, discord_id, riot_id)]
+        self.keys = {}                                                # (queue_type, discord_id, riot_id) -> item in entries
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, discord_id, riot_id, queue_type, entry):
+        self.discard(discord_id, riot_id, queue_type)
+        item = (-entry.score, -entry.league_points, discord_id, riot_id)
+        bisect.insort(self.entries[queue_type], item)
+        self.keys[(queue_type, discord_id, riot_id)] = item
+
+    def discard(self, discord_id, riot_id, queue_type):
+        item = self.keys.pop((queue_type, discord_id, riot_id), None)
+        if item is not None:
+            entries = self.entries[queue_type]
+            del entries[bisect.bisect_left(entries, item)]
+
+    def remove(self, discord_id, riot_id):
+        for queue_type in QueueType:
+            self.discard(discord_id, riot_id, queue_type)
+
+    def rebuild(self, player_data):
+        self.entries = {queue_type: [] for queue_type in QueueType}
+        self.keys = {}
+        for discord_id, riot_id_data in player_data.items():
+            for riot_id, data in riot_id_data.items():
+                for queue_type, entry in data.league_entries.items():
+                    item = (-entry.score, -entry.league_points, discord_id, riot_id)
+                    self.entries[queue_type].append(item)
+                    self.keys[(queue_type, discord_id, riot_id)] = item
+        for entries in self.entries.values():
+            entries.sort()
+
+    def page(self, queue_type, page, page_size=LEADERBOARD_PAGE_SIZE, member=None):
+        """Return (total, [(position, discord_id, riot_id)]) for a 1-based page.
+
+        member(discord_id) limits the board to accounts it returns something for, e.g. guild.get_member.
+        """
+        entries = self.entries[queue_type]
+        start = (page - 1) * page_size
+        if member is None:
+            rows = [(start + i + 1, item[2], item[3]) for i, item in enumerate(entries[start:start + page_size])]
+            return len(entries), rows
+
+        total = 0
+        rows = []
+        for item in entries:
+            if member(item[2]) is None:
+                continue
+            total += 1
+            if start < total <= start + page_size:
+                rows.append((total, item[2], item[3]))
+        return total, rows
+
+rank_index = RankIndex()
+
 # Helper functions
-async def update_streaks(user_id, riot_id, match_id):
-    # Fetch Match Details
+async def get_match_details(match_id):
     region = API_REGIONS["match"]
-    url = f"https://{region}.api.riotgames.com/lol/match/v5/matches/{match_id}?api_key={api_key}"
+    url = f"{riot_api_base(region)}/lol/match/v5/matches/{match_id}?api_key={api_key}"
 
     try:
-        response = get_with_retry(url)
-    except requests.exceptions.RequestException as e:
+        response = await get_with_retry(url, region, "match-v5.match")
+    except aiohttp.ClientError as e:
         print(f"Error fetching match details after retries: {e}")
-        return
+        return None
 
     if response.status_code == 200:
         match_data = response.json()
@@ -267,102 +2041,407 @@ async def update_streaks(user_id, riot_id, match_id):
         # Data Validation
         if not isinstance(match_data.get("info"), dict):
             print(f"Error updating streaks: Unexpected match data format - {match_data}")
-            return
+            return None
 
-        queue_id = match_data["info"]["queueId"]
+        return match_data
+    else:
+        print(f"Error fetching match details: {response.status_code} - {response.text}")
+        return None
 
-        # Map Queue ID to Streak Type
-        streak_type = {
-            400: "quickplay/draftpick",
-            430: "quickplay/draftpick",
-            420: "ranked_solo_duo",
-            440: "ranked_flex",
-            450: "aram",
-            1700: "arena",  # Updated to 1700 for Clash
-            # ... (Add more as needed)
-        }.get(queue_id)
+async def update_streaks(user_id, riot_id, match_id):
+    # Fetch Match Details
+    match = await match_cache.get(match_id)
+    if match:
+        await apply_match(user_id, riot_id, match_id, match)
 
-        if not streak_type:
-            print(f"Unsupported queue type: {queue_id}")
-            return
+async def apply_match(user_id, riot_id, match_id, match):
+    # Map Queue ID to Streak Type
+    streak_type = QUEUE_STREAK_TYPES.get(match.queue_id)
+
+    if not streak_type:
+        print(f"Unsupported queue type: {match.queue_id}")
+        return
+
+    account = player_data[user_id][riot_id]
+    account.last_queue_type = streak_type
+
+    # Find the participant matching the puuid
+    win = match.result(account.puuid)
+    if win is None:  # No participant with matching PUUID found
+        print(f"Error updating streaks: Participant with PUUID '{account.puuid}' not found in match {match_id}")
+        return
 
-        player_data[user_id][riot_id]["last_queue_type"] = streak_type
-
-        # Find the participant matching the puuid
-        for participant in match_data["info"]["participants"]:
-            if participant["puuid"] == player_data[user_id][riot_id]["puuid"]:
-                # Update Streak
-                streak_data = player_data[user_id][riot_id]["streaks"][streak_type]
-                if participant["win"]:
-                    streak_data["wins"] += 1
-                    streak_data["losses"] = 0
-                else:
-                    streak_data["losses"] += 1
-                    streak_data["wins"] = 0
-
-                # Mention Dasken (only if a loss)
-                if user_id == 183253004005146625 and not participant["win"]:
-                    channel = bot.get_channel(CHANNEL_ID)
-                    user = await bot.fetch_user(183253004005146625)
-                    await channel.send(
-                        f"{user.mention} just lost a game in {streak_type} with Riot ID: {riot_id}"
+    # Update Streak. Once the history is backfilled it is derived from the log, before that
+    # counted, but only for games the log hadn't seen yet
+    logged = match_history.add(account.puuid, match_id, match)
+    if account.puuid in match_history.backfilled:
+        account.streaks[streak_type] = match_history.histories[account.puuid].streak(streak_type)
+    elif logged:
+        account.streaks[streak_type].record(win)
+
+    # Mention Dasken (only if a loss)
+    if user_id == 183253004005146625 and not win:
+        notifications.announce(user_id, f"just lost a game in {streak_type} with Riot ID: {riot_id}")
+
+async def poll_account(data, semaphore):
+    """Fetch everything one account needs this cycle. Only reads player_data, never writes it.
+
+    Returns (new matches, league entries, skipped), skipped is True when an open breaker
+    or a failed fetch left part of the work for the next poll.
+    """
+    async with semaphore:
+        # Rounded down to the hour, so repeated polls build the same URL and can share a cached response
+        start_time = (int(time.time()) - MATCH_CATCHUP_SECONDS) // 3600 * 3600
+        # Skip what a breaker would reject anyway. New games wait for the next poll, since
+        # last_match_id only moves on when they are fetched
+        skip_matches = (
+            circuit_breakers.is_open(API_REGIONS["match"], "match-v5.ids-by-puuid")
+            or circuit_breakers.is_open(API_REGIONS["match"], "match-v5.match")
+        )
+        skip_league = circuit_breakers.is_open(API_REGIONS["league"], "league-v4.entries-by-summoner")
+        new_match_ids, new_league_entries = await asyncio.gather(
+            asyncio.sleep(0) if skip_matches else get_new_match_ids(data.puuid, data.last_match_id, start_time),
+            asyncio.sleep(0) if skip_league else get_league_entries(data.summoner_id)
+        )
+        new_match_ids = new_match_ids or []
+        matches = await asyncio.gather(*(match_cache.get(match_id) for match_id in new_match_ids))
+        skipped = skip_matches or skip_league
+        if None in matches:
+            # A fetch failed (timeout, 5xx, open breaker), leave the games from the first missing one
+            # for the next poll instead of skipping it for good
+            cut = matches.index(None)
+            new_match_ids, matches = new_match_ids[:cut], matches[:cut]
+            skipped = True
+        return list(zip(new_match_ids, matches)), new_league_entries, skipped
+
+async def apply_poll_result(discord_id, riot_id, data, result):
+    """Apply one account's poll result and return whether anything changed."""
+    active = False
+    new_matches, new_league_entries, _ = result
+    if new_matches:
+        # New Matches Found, oldest first so the streaks end up right
+        active = True
+        for match_id, match in new_matches:  # poll_account already cut them at the first failed fetch
+            await apply_match(discord_id, riot_id, match_id, match)
+            data.last_match_id = match_id
+
+    # Check for Rank Changes
+    if new_league_entries:
+        for queue_type, entry in new_league_entries.items():
+            old_entry = data.league_entries.get(queue_type)  # Get existing entry if it exists
+
+            # If the queue type doesn't exist yet, treat it as a new entry
+            if old_entry is None:
+                notifications.announce(
+                    discord_id, f"has a new rank in {queue_type}: {entry.tier_name} {entry.division_name} with Riot ID: {riot_id}"
+                )
+            else:
+                # If the queue type exists, check for rank changes
+                if old_entry.score != entry.score:
+                    change = "promoted" if entry.score > old_entry.score else "demoted"
+                    notifications.announce(
+                        discord_id, f"has been **{change}** to **{entry.tier_name} {entry.division_name}** in {queue_type} with Riot ID: {riot_id}"
                     )
-                
-                await save_player_data()
-                break  # No need to continue searching
-        else:  # No participant with matching PUUID found
-            print(f"Error updating streaks: Participant with PUUID '{player_data[user_id][riot_id]['puuid']}' not found in match {match_id}")
-    else:
-        print(f"Error fetching match details: {response.status_code} - {response.text}")
+            if old_entry != entry:
+                active = True
+                rank_index.update(discord_id, riot_id, queue_type, entry)
+            data.league_entries[queue_type] = entry # Make sure to always update league entries regardless of tier change
+    return active
+
+# Sharded polling
+def shard_weight(worker_id, puuid):
+    return hashlib.blake2b(f"{worker_id}:{puuid}".encode(), digest_size=8).digest()
+
+def assign_shard(puuid, worker_ids):
+    """Rendezvous hashing: adding or removing a worker only moves that worker's share of accounts."""
+    return max(worker_ids, key=lambda worker_id: shard_weight(worker_id, puuid))
+
+def run_poll_worker(worker_id, worker_api_key, key_share, jobs, results):
+    """Entry point of a worker process. It has its own session, rate limiter, breakers and match cache."""
+    asyncio.run(poll_worker(worker_id, worker_api_key, key_share, jobs, results))
+
+async def poll_worker(worker_id, worker_api_key, key_share, jobs, results):
+    global api_key
+    api_key = worker_api_key
+    rate_limiter.set_share(key_share)  # Other processes send requests with the same key
+    request_lane.set(LANE_BACKGROUND)  # Workers only ever poll
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+    try:
+        while True:
+            job = await loop.run_in_executor(None, jobs.get)
+            if job is None:
+                break
+            cycle_id, accounts = job
+            polled = await asyncio.gather(
+                *(poll_account(data, semaphore) for _, _, data in accounts),
+                return_exceptions=True
+            )
+            # Exceptions don't always pickle, send their repr instead
+            results.put((worker_id, cycle_id, [
+                (discord_id, riot_id, ("error", repr(result)) if isinstance(result, Exception) else ("ok", result))
+                for (discord_id, riot_id, _), result in zip(accounts, polled)
+            ]))
+    finally:
+        await close_http_session()
+
+class PollWorkerPool:
+    """Worker processes that poll the accounts of their shard and send the results back.
+
+    The results are applied here, in the process connected to Discord, exactly like
+    results polled in-process. Accounts are assigned by rendezvous hash of their puuid
+    over the live workers, so a worker that dies (and is restarted) only moves its own
+    share. The number of workers is fixed at startup (poll_workers), changing it needs
+    a restart.
+
+    Processes that share an API key, including this one, each get an equal part of its
+    rate limits. Each worker checks its own circuit breakers, this process never sees
+    the polling traffic.
+    """
+
+    def __init__(self, size, api_keys):
+        self.context = multiprocessing.get_context("spawn")
+        self.api_keys = api_keys
+        self.results = self.context.Queue()
+        self.workers = {}  # worker_id -> (process, jobs queue)
+        self.cycle_ids = itertools.count(1)
+        self.inbox = None
+        self.size = size
+        rate_limiter.set_share(1 / self.key_users(api_key))  # Slash commands and the backfill use the rest
+        for worker_id in range(size):
+            self._spawn(worker_id)
+
+    def worker_key(self, worker_id):
+        return self.api_keys[worker_id % len(self.api_keys)]
+
+    def key_users(self, key):
+        """Processes sending requests with the key: its workers, plus this one for the bot's own key."""
+        return sum(1 for worker_id in range(self.size) if self.worker_key(worker_id) == key) + (key == api_key)
+
+    def _spawn(self, worker_id):
+        jobs = self.context.Queue()
+        key = self.worker_key(worker_id)
+        process = self.context.Process(
+            target=run_poll_worker,
+            args=(worker_id, key, 1 / self.key_users(key), jobs, self.results),
+            name=f"lolbot-poll-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self.workers[worker_id] = (process, jobs)
+
+    def live_workers(self):
+        """Ids of running workers. Dead ones are restarted for the next cycle."""
+        live = []
+        for worker_id, (process, _) in list(self.workers.items()):
+            if process.is_alive():
+                live.append(worker_id)
+            else:
+                print(f"Poll worker {worker_id} exited with code {process.exitcode}, restarting it")
+                self._spawn(worker_id)
+        return live
+
+    def _read_results(self, loop):
+        while True:
+            item = self.results.get()
+            if item is None:
+                break
+            loop.call_soon_threadsafe(self.inbox.put_nowait, item)
+
+    async def poll(self, accounts):
+        """Poll accounts on the workers. Returns results in the order of accounts, like asyncio.gather."""
+        if self.inbox is None:
+            self.inbox = asyncio.Queue()
+            threading.Thread(target=self._read_results, args=(asyncio.get_running_loop(),), daemon=True).start()
+
+        worker_ids = self.live_workers()
+        if not worker_ids:
+            return [RuntimeError("No poll workers running")] * len(accounts)
+
+        cycle_id = next(self.cycle_ids)
+        shards = defaultdict(list)
+        for discord_id, riot_id, data in accounts:
+            shard_data = Account(data.puuid, data.summoner_id, data.last_match_id)
+            shards[assign_shard(data.puuid, worker_ids)].append((discord_id, riot_id, shard_data))
+        for worker_id, shard in shards.items():
+            self.workers[worker_id][1].put((cycle_id, shard))
+
+        polled = {}
+        pending = set(shards)
+        deadline = time.monotonic() + POLL_WORKER_TIMEOUT
+        while pending:
+            try:
+                worker_id, result_cycle_id, shard_results = await asyncio.wait_for(
+                    self.inbox.get(), max(deadline - time.monotonic(), 0)
+                )
+            except asyncio.TimeoutError:
+                print(f"Poll workers {sorted(pending)} didn't answer within {POLL_WORKER_TIMEOUT}s")
+                break
+            if result_cycle_id != cycle_id:
+                continue  # Late answer from a cycle we gave up on
+            pending.discard(worker_id)
+            for discord_id, riot_id, (status, result) in shard_results:
+                polled[(discord_id, riot_id)] = result if status == "ok" else RuntimeError(result)
+
+        return [
+            polled.get((discord_id, riot_id), TimeoutError("No result from poll worker"))
+            for discord_id, riot_id, _ in accounts
+        ]
+
+    def stop(self):
+        for _, jobs in self.workers.values():
+            jobs.put(None)
+        self.results.put(None)
+        for process, _ in self.workers.values():
+            process.join(timeout=5)
+        self.workers.clear()
+
+poll_workers = None
+
+# Calls one poll makes per region: match IDs plus about one new game, and the league entries
+POLL_CALLS_PER_ACCOUNT = {"match": 2, "league": 1}
+
+def poll_budget():
+    """Accounts this cycle can poll within the background lane's rate limit left, None when nothing limits it.
+
+    Windows shorter than a tick are ignored, they refill while the cycle runs.
+    """
+    budgets = []
+    for region, calls in POLL_CALLS_PER_ACCOUNT.items():
+        headroom = rate_limiter.headroom(API_REGIONS[region], horizon=POLL_TICK_SECONDS, lane=LANE_BACKGROUND)
+        if headroom is not None:
+            budgets.append(headroom // calls)
+    return min(budgets) if budgets else None
 
 @tasks.loop(minutes=1)  
 async def check_for_updates():
-    channel = bot.get_channel(CHANNEL_ID)
-    for discord_id, riot_id_data in player_data.items():
-        user = await bot.fetch_user(discord_id)
-        for riot_id, data in riot_id_data.items():
-            last_match_id = data["last_match_id"]
-
-            # Fetch Recent Match IDs
-            new_match_id = await get_last_match_id(data["puuid"])
-            if new_match_id and new_match_id != last_match_id:
-                # New Match Found
-                data["last_match_id"] = new_match_id
-                await update_streaks(discord_id, riot_id, new_match_id)
-
-            # Check for Rank Changes
-            new_league_entries = await get_league_entries(data["summoner_id"])
-            if new_league_entries:
-                for queue_type, entry in new_league_entries.items():
-                    old_entry = data["league_entries"].get(queue_type)  # Get existing entry if it exists
-
-                    # If the queue type doesn't exist yet, treat it as a new entry
-                    if old_entry is None:
-                        data["league_entries"][queue_type] = entry
-                        await channel.send(
-                            f"{user.mention} has a new rank in {queue_type}: {entry['tier']} {entry['rank']} with Riot ID: {riot_id}"
-                        )
-                    else:
-                        # If the queue type exists, check for rank changes
-                        if old_entry != entry:
-                            old_tier_value = TIER_VALUES.get(old_entry["tier"], -1)
-                            new_tier_value = TIER_VALUES.get(entry["tier"], -1)
-                            old_division_value = DIVISION_VALUES.get(old_entry["rank"], -1)
-                            new_division_value = DIVISION_VALUES.get(entry["rank"], -1)
-
-                            if new_tier_value != old_tier_value or new_division_value != old_division_value:
-                                overall_change = new_tier_value * 4 + new_division_value - (old_tier_value * 4 + old_division_value)
-                                change = "promoted" if overall_change > 0 else "demoted"
-                                await channel.send(
-                                    f"{user.mention} has been **{change}** to **{entry['tier']} {entry['rank']}** in {queue_type} with Riot ID: {riot_id}"
-                                )
-                    data["league_entries"][queue_type] = entry # Make sure to always update league entries regardless of tier change
+    started = time.monotonic()
+
+    # Snapshot the due accounts, /register and /unregister can change player_data while we wait on Riot
+    accounts = [
+        (discord_id, riot_id, player_data[discord_id][riot_id])
+        for discord_id, riot_id in poll_scheduler.pop_due(started)
+        if riot_id in player_data.get(discord_id, {})
+    ]
+
+    # Don't start more polls than the rate limit has room for, the rest stays due for the next tick.
+    # Poll workers have their own limiters, ours doesn't see their traffic
+    budget = poll_budget() if poll_workers is None else None
+    if budget is not None and budget < len(accounts):
+        for discord_id, riot_id, _ in accounts[budget:]:
+            poll_scheduler.schedule((discord_id, riot_id))
+        print(f"Rate limit headroom for {budget} accounts, deferring {len(accounts) - budget}")
+        accounts = accounts[:budget]
+    total_accounts = sum(len(riot_id_data) for riot_id_data in player_data.values())
+    poll_stats.update(due=len(accounts), skipped=total_accounts - len(accounts), active=0, duration=0.0)
+    if not accounts:
+        return
+
+    # Degraded mode: with every polled endpoint failing, try again after the cooldown instead of hammering Riot.
+    # Poll workers check their own breakers, ours never see their traffic
+    if poll_workers is None and all(circuit_breakers.is_open(API_REGIONS[region], endpoint) for region, endpoint in (
+        ("match", "match-v5.ids-by-puuid"), ("league", "league-v4.entries-by-summoner")
+    )):
+        for discord_id, riot_id, _ in accounts:
+            poll_scheduler.schedule((discord_id, riot_id), BREAKER_COOLDOWN)
+        print(f"Poll cycle skipped, Riot endpoints unavailable: {circuit_breakers.snapshot()}")
+        return
+
+    # pop_due took the accounts off the scheduler, make sure they go back even if polling fails or is cancelled
+    unscheduled = {(discord_id, riot_id) for discord_id, riot_id, _ in accounts}
+    try:
+        if poll_workers:
+            results = await poll_workers.poll(accounts)
+        else:
+            semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+            with request_priority(LANE_BACKGROUND):
+                results = await asyncio.gather(
+                    *(poll_account(data, semaphore) for _, _, data in accounts),
+                    return_exceptions=True
+                )
+
+        # Apply results in registration order, so announcements don't depend on which request finished first
+        for (discord_id, riot_id, data), result in zip(accounts, results):
+            if player_data.get(discord_id, {}).get(riot_id) is not data:
+                unscheduled.discard((discord_id, riot_id))
+                continue  # Unregistered while we were polling
+
+            active = False
+            skipped = False
+            if isinstance(result, Exception):
+                print(f"Error polling Riot ID {riot_id}: {result!r}")
+            else:
+                skipped = result[2]
+                try:
+                    active = await apply_poll_result(discord_id, riot_id, data, result)
+                except Exception as e:
+                    print(f"Error applying updates for Riot ID {riot_id}: {e!r}")
+            if active:
+                poll_stats["active"] += 1
+                mark_dirty(discord_id, riot_id)
+            if skipped and not active:
+                # An outage says nothing about the player, retry after the cooldown and keep their interval
+                poll_scheduler.schedule((discord_id, riot_id), BREAKER_COOLDOWN)
+            else:
+                poll_scheduler.reschedule((discord_id, riot_id), active)
+            unscheduled.discard((discord_id, riot_id))
+    finally:
+        for discord_id, riot_id in unscheduled:
+            if riot_id in player_data.get(discord_id, {}):
+                poll_scheduler.schedule((discord_id, riot_id))
+
+    notifications.flush()
     await save_player_data()
 
-def get_with_retry(url, max_retries=3, retry_delay=2):
-    """Generic function to make API calls with retry logic."""
+    poll_stats["duration"] = time.monotonic() - started
+    print(f"Poll cycle: {poll_stats['due']} due, {poll_stats['skipped']} skipped, {poll_stats['active']} active in {poll_stats['duration']:.1f}s")
+
+async def get_with_retry(url, region=None, endpoint=None, max_retries=3, retry_delay=2):
+    """Generic function to make API calls with retry logic.
+
+    Identical concurrent calls share one request (see SingleFlight). Calls with a region go
+    through the rate limiter first, so they wait for capacity instead of running into 429s.
+    Data Dragon calls pass no region and are not limited.
+    """
+    return await single_flight.run(
+        url, endpoint or "ddragon", lambda: fetch_with_retry(url, region, endpoint, max_retries, retry_delay)
+    )
+
+async def fetch_with_retry(url, region, endpoint, max_retries, retry_delay):
+    session = get_http_session()
     for attempt in range(max_retries):
-        response = requests.get(url)
+        last_attempt = attempt + 1 == max_retries
+        endpoint_label = endpoint or "ddragon"
+        if attempt:
+            metrics.inc("lolbot_riot_retries_total", endpoint=endpoint_label)
+        circuit_region = region or "ddragon"
+        circuit_breakers.before_call(circuit_region, endpoint_label)  # Fails fast while Riot is down
+        if region:
+            lane = request_lane.get()
+            waited = await rate_limiter.acquire(region, endpoint, lane)
+            metrics.observe("lolbot_rate_limiter_wait_seconds", waited, region=region, endpoint=endpoint, lane=lane)
+
+        started = time.perf_counter()
+        try:
+            async with session.get(url) as resp:
+                response = RiotResponse(resp.status, resp.headers, await resp.text())
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            metrics.observe("lolbot_riot_request_seconds", time.perf_counter() - started, endpoint=endpoint_label, status="error")
+            circuit_breakers.failure(circuit_region, endpoint_label)
+            if last_attempt:
+                raise aiohttp.ServerTimeoutError(f"Request failed after {max_retries} attempts: {e!r}") from e
+            retry_after = retry_delay * 2 ** attempt
+            print(f"Connection error on attempt {attempt + 1}. Retrying after {retry_after} seconds...")
+            await asyncio.sleep(retry_after)
+            continue
+
+        metrics.observe("lolbot_riot_request_seconds", time.perf_counter() - started, endpoint=endpoint_label, status=response.status_code)
+        if region:
+            rate_limiter.update(region, endpoint, response.headers)
+        if response.status_code >= 500:
+            circuit_breakers.failure(circuit_region, endpoint_label)
+        else:
+            circuit_breakers.success(circuit_region, endpoint_label)
 
         if response.status_code == 200:
             return response  # Return the successful response
@@ -371,11 +2450,17 @@ def get_with_retry(url, max_retries=3, retry_delay=2):
         elif response.status_code in (429, 500, 503):  
             if response.status_code == 429:
                 retry_after = int(response.headers.get("Retry-After", 1))
+                if region:
+                    # The limiter holds every request to the bucket until Retry-After, including our retry
+                    rate_limiter.penalize(region, endpoint, retry_after, response.headers.get("X-Rate-Limit-Type"))
             else:
-                retry_after = retry_delay  # Default retry delay for 500 and 503
+                retry_after = retry_delay * 2 ** attempt  # Exponential backoff for 500 and 503
 
+            if last_attempt:
+                break
             print(f"Rate limited/Server error (500/503) on attempt {attempt + 1}. Retrying after {retry_after} seconds...")
-            time.sleep(retry_after)
+            if not (region and response.status_code == 429):
+                await asyncio.sleep(retry_after)
 
         else:
             response.raise_for_status()  # Raise an exception for other errors
@@ -383,22 +2468,157 @@ def get_with_retry(url, max_retries=3, retry_delay=2):
     # If we've reached max retries, raise an exception with the last response
     response.raise_for_status()
 
+def collect_bot_stats(metrics):
+    """Copy the stats the subsystems keep themselves into gauges and counters."""
+    metrics.set("lolbot_accounts", sum(len(riot_id_data) for riot_id_data in player_data.values()))
+    metrics.set("lolbot_scheduled_accounts", len(poll_scheduler))
+    for key in ("due", "skipped", "active"):
+        metrics.set("lolbot_poll_last_cycle_accounts", poll_stats[key], state=key)
+    metrics.set_total("lolbot_save_flushes_total", save_stats["flushes"])
+    metrics.set_total("lolbot_save_accounts_written_total", save_stats["accounts_written"])
+    metrics.set_total("lolbot_save_bytes_written_total", save_stats["bytes_written"])
+    limiter = rate_limiter.snapshot()
+    for region, remaining in limiter["app"].items():
+        if remaining is not None:
+            metrics.set("lolbot_rate_limiter_headroom", remaining, region=region)
+    for lane, stats in limiter["lanes"].items():
+        metrics.set("lolbot_rate_limiter_queued", stats["queued"], lane=lane)
+    for key, state in circuit_breakers.snapshot().items():
+        region, endpoint = key.split("/", 1)
+        metrics.set("lolbot_circuit_state", CircuitBreakers.STATES[state], region=region, endpoint=endpoint)
+    for result, count in user_resolver.stats.items():
+        metrics.set_total("lolbot_user_cache_lookups_total", count, result=result)
+    metrics.set_total("lolbot_match_cache_lookups_total", match_cache.hits, result="hit")
+    metrics.set_total("lolbot_match_cache_lookups_total", match_cache.disk_hits, result="disk_hit")
+    metrics.set_total("lolbot_match_cache_lookups_total", match_cache.misses, result="miss")
+    metrics.set("lolbot_match_cache_bytes", match_cache.size)
+    metrics.set_total("lolbot_mastery_cache_lookups_total", mastery_cache.hits, result="hit")
+    metrics.set_total("lolbot_mastery_cache_lookups_total", mastery_cache.misses, result="miss")
+    for endpoint, counts in list(single_flight.stats.items()):
+        for result, count in counts.items():
+            metrics.set_total("lolbot_riot_dedup_calls_total", count, endpoint=endpoint, result=result)
+    metrics.set("lolbot_announcements_queued", notifications.depth())
+    for key, count in notifications.stats.items():
+        metrics.set_total("lolbot_announcements_total", count, kind=key)
+
+    for phase, seconds in startup_stats.items():
+        metrics.set("lolbot_startup_seconds", seconds, phase=phase)
+
+metrics.collectors.append(collect_bot_stats)
+metrics_runner = None
+lag_monitor_task = None
+
+# Startup
+startup_stats = {}  # phase -> seconds since PROCESS_STARTED (first_command_latency: since the interaction was created)
+state_ready = asyncio.Event()
+startup_task = None
+
+def record_startup(phase, seconds=None):
+    if phase not in startup_stats:
+        startup_stats[phase] = round(time.monotonic() - PROCESS_STARTED if seconds is None else seconds, 3)
+        print(f"Startup: {phase} after {startup_stats[phase]:.2f}s")
+
+def command_definitions_hash():
+    commands_payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    payload = json.dumps({"application_id": bot.application_id, "commands": commands_payload}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+async def sync_commands():
+    """Sync the slash commands with Discord, but only when their definitions changed since the last sync."""
+    command_hash = command_definitions_hash()
+    try:
+        with open(COMMAND_HASH_FILE, "r") as f:
+            if f.read().strip() == command_hash:
+                print("Commands unchanged, not syncing")
+                return
+    except FileNotFoundError:
+        pass
+
+    synced = await bot.tree.sync()
+    print(f"Synced {len(synced)} command(s)")
+    with open(COMMAND_HASH_FILE, "w") as f:
+        f.write(command_hash)
+
+async def warm_user_cache(concurrency=2):
+    """Resolve registered users the gateway cache doesn't have, so announcements don't wait on REST later."""
+    await bot.wait_until_ready()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(discord_id):
+        async with semaphore:
+            try:
+                await user_resolver.resolve(discord_id)
+            except discord.HTTPException as e:
+                print(f"Error warming user {discord_id}: {e}")
+
+    missing = [discord_id for discord_id in list(player_data) if bot.get_user(discord_id) is None]
+    await asyncio.gather(*(resolve(discord_id) for discord_id in missing))
+    record_startup("user_cache_warm")
+
+async def startup():
+    """Runs once per process, from setup_hook, while the gateway connects. Reconnects don't repeat it."""
+    global metrics_runner, lag_monitor_task, poll_workers
+    try:
+        # State first: commands wait for it (see LolbotTree.interaction_check)
+        await load_player_data()
+        state_ready.set()
+        record_startup("state_loaded")
+
+        await asyncio.to_thread(ddragon_cache.load)
+        record_startup("ddragon_loaded")
+        try:
+            await sync_commands()
+        except Exception as e:
+            print(f"Error syncing commands: {e}")
+
+        if not update_checker.is_running():
+            update_checker.start()
+        if not ddragon_refresher.is_running():
+            ddragon_refresher.start()  # Its first run refreshes Data Dragon if the cache is stale
+        if not player_data_flusher.is_running():
+            player_data_flusher.start()
+        if not match_history_backfiller.is_running():
+            match_history_backfiller.start()
+        if POLL_WORKERS and poll_workers is None:
+            poll_workers = PollWorkerPool(POLL_WORKERS, WORKER_API_KEYS)
+        if METRICS_PORT and metrics_runner is None:
+            metrics_runner = await start_metrics_server(METRICS_PORT)
+        if lag_monitor_task is None:
+            lag_monitor_task = asyncio.create_task(monitor_event_loop_lag())
+        notifications.start()
+        await warm_user_cache()
+    except Exception as e:
+        print(f"Error during startup: {e!r}")
+        state_ready.set()  # Don't keep commands waiting forever
+
 # Bot logic
+class LolbotTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction: discord.Interaction):
+        if not state_ready.is_set():
+            await state_ready.wait()
+        return True
+
+class Lolbot(commands.Bot):
+    async def setup_hook(self):
+        global startup_task
+        startup_task = asyncio.create_task(startup())
+
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix=None, intents=intents)
+bot = Lolbot(command_prefix=None, intents=intents, tree_cls=LolbotTree)
 
 @bot.event
 async def on_ready():
+    # Fires again after every reconnect, everything that should run once is in startup()
     print(f'Logged in as {bot.user.name}')
-    await load_player_data()
-    try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} command(s)")
-    except Exception as e:
-        print(e)
-    update_checker.start()
+    record_startup("ready")
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    if "first_command" not in startup_stats:
+        record_startup("first_command")
+        record_startup("first_command_latency", (discord.utils.utcnow() - interaction.created_at).total_seconds())
 
 
 @bot.tree.command(name="register", description="Register a League of Legends account.")
@@ -433,25 +2653,16 @@ async def register(interaction: discord.Interaction, riot_id: str, user: discord
     if user.id not in player_data:
         player_data[user.id] = {}
 
-    player_data[user.id][riot_id] = {
-        "puuid": puuid,
-        "summoner_id": summoner_id,
-        "league_entries": league_entries,
-        "last_match_id": last_match_id,
-        "streaks": {
-            "quickplay/draftpick": {"wins": 0, "losses": 0},
-            "ranked_solo_duo": {"wins": 0, "losses": 0},
-            "ranked_flex": {"wins": 0, "losses": 0},
-            "aram": {"wins": 0, "losses": 0},
-            "arena": {"wins": 0, "losses": 0}
-        },
-        "last_queue_type": None
-    }
+    player_data[user.id][riot_id] = Account(puuid, summoner_id, last_match_id, league_entries=league_entries)
+    for queue_type, entry in (league_entries or {}).items():
+        rank_index.update(user.id, riot_id, queue_type, entry)
 
     if last_match_id:
         await update_streaks(user.id, riot_id, last_match_id)
+        notifications.flush()
 
-    await save_player_data()
+    mark_dirty(user.id, riot_id)
+    poll_scheduler.schedule((user.id, riot_id), POLL_MIN_INTERVAL)
     await interaction.response.send_message(f"{user.mention}, you have been registered with Riot ID: {riot_id}")
 
 @bot.tree.command(name="unregister", description="Unregister a League of Legends account.")
@@ -462,10 +2673,13 @@ async def unregister(interaction: discord.Interaction, riot_id: str, user: disco
     user_id = user.id
     if user_id in player_data and riot_id in player_data[user_id]:
         del player_data[user_id][riot_id]  
+        poll_scheduler.remove((user_id, riot_id))
+        rank_index.remove(user_id, riot_id)
+        removed_accounts.add((user_id, riot_id))
+        dirty_accounts.discard((user_id, riot_id))
         # Remove user if no more Riot IDs are left
         if not player_data[user_id]:
             del player_data[user_id]
-        await save_player_data()
         await interaction.response.send_message(f"{user.mention}, you have been unregistered from Riot ID: {riot_id}")
     else:
         await interaction.response.send_message(f"{user.mention}, you are not registered with Riot ID: {riot_id}")
@@ -473,50 +2687,54 @@ async def unregister(interaction: discord.Interaction, riot_id: str, user: disco
 @bot.tree.command(name="mastery", description="Display champion mastery levels for a user.")
 async def mastery(interaction: discord.Interaction, user: discord.Member, champion_name: str):
     user_id = user.id  # No need to convert to string
-    if user_id in player_data:
-        riot_ids = player_data[user_id].keys()
-        region = API_REGIONS["summoner"]  # Updated to correct region
-        champion_id = await get_champion_id(champion_name)
+    if user_id not in player_data:
+        await interaction.response.send_message(f"User {user.mention} is not registered with the bot.")
+        return
 
-        if champion_id is None:  # Handle invalid champion name
-            await interaction.response.send_message(f"Invalid champion name: {champion_name}")
-            return
+    # Riot can take longer than the 3 second interaction deadline, answer in a followup
+    await interaction.response.defer()
+    region = API_REGIONS["summoner"]  # Updated to correct region
+    champion_id = await get_champion_id(champion_name)
+    if champion_id is None:  # Handle invalid champion name
+        await interaction.followup.send(f"Invalid champion name: {champion_name}")
+        return
 
-        mastery_info = []
-        for riot_id in riot_ids:
-            puuid = player_data[user_id][riot_id]["puuid"]  # Get puuid for each riot_id
-            try:
-                url = f"https://{region}.api.riotgames.com/lol/champion-mastery/v4/champion-masteries/by-puuid/{puuid}/by-champion/{champion_id}?api_key={api_key}"
-                response = requests.get(url)
-                response.raise_for_status()
-
-                # Get the mastery directly from the response
-                mastery_data = response.json()
-                mastery_level = mastery_data["championLevel"]
-                mastery_points = mastery_data["championPoints"]
-
-                # Add playertag (from riot_id)
-                playertag = riot_id
-                mastery_info.append(f"{playertag} ({region}): Level {mastery_level}, {mastery_points} points")
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 404:
-                    mastery_info.append(f"{riot_id} ({region}): Not found")
-                else:
-                    await interaction.response.send_message(f"Error fetching mastery for {riot_id}: {e}")
-                    return  # Early return on unexpected errors
-
-        if mastery_info:
-            await interaction.response.send_message("\n".join(mastery_info))
+    riot_ids = list(player_data[user_id].items())
+    results = await asyncio.gather(
+        *(mastery_cache.get(data.puuid, champion_id) for riot_id, data in riot_ids),
+        return_exceptions=True
+    )
+
+    mastery_info = []
+    for (riot_id, data), result in zip(riot_ids, results):
+        if isinstance(result, Exception):
+            mastery_info.append(f"{riot_id} ({region}): Error fetching mastery: {result}")
+        elif result is None:
+            mastery_info.append(f"{riot_id} ({region}): Not found")
         else:
-            await interaction.response.send_message(f"No mastery information found for {champion_name}.")
+            mastery_level, mastery_points = result
+            mastery_info.append(f"{riot_id} ({region}): Level {mastery_level}, {mastery_points} points")
+
+    if mastery_info:
+        await interaction.followup.send("\n".join(mastery_info)[:DISCORD_MESSAGE_LIMIT])
     else:
-        await interaction.response.send_message(f"User {user.mention} is not registered with the bot.")
+        await interaction.followup.send(f"No mastery information found for {champion_name}.")
 
 @bot.tree.command(name="build", description="Get a link to U.GG builds for a champion.")
 async def build(interaction: discord.Interaction, champion_name: str):
-    champion_name = champion_name.lower()
-    url = f"https://u.gg/lol/champions/{champion_name}/build?rank=diamond_plus"
-    await interaction.response.send_message(f"Here's the build for {champion_name.capitalize()} on U.GG: {url}")
+    # U.GG paths use the Data Dragon id ("nunu", "kaisa"), not the display name ("Nunu & Willump", "Kai'Sa")
+    champion_id = await get_champion_id(champion_name)
+    if champion_id is None:
+        await interaction.response.send_message(f"Invalid champion name: {champion_name}")
+        return
+    champion = ddragon_cache.champions[champion_id]
+    url = f"https://u.gg/lol/champions/{quote(champion['id'].lower())}/build?rank=diamond_plus"
+    await interaction.response.send_message(f"Here's the build for {champion['name']} on U.GG: {url}")
+
+@mastery.autocomplete("champion_name")
+@build.autocomplete("champion_name")
+async def champion_name_autocomplete(interaction: discord.Interaction, current: str):
+    return [app_commands.Choice(name=name, value=name) for name in ddragon_cache.search(current)]
 
 @bot.tree.command(name="rank", description="Display rank information for a user.")
 async def rank(interaction: discord.Interaction, user: discord.Member = None):
@@ -528,12 +2746,10 @@ async def rank(interaction: discord.Interaction, user: discord.Member = None):
     if user_id in player_data:
         ranks_info = []
         for riot_id, data in player_data[user_id].items():
-            league_entries = data.get("league_entries")
-            if league_entries:
-                for queue_type, entry in league_entries.items():
-                    ranks_info.append(
-                        f"Riot ID: {riot_id} - {queue_type}: {entry['tier']} {entry['rank']} ({entry['leaguePoints']} LP)"
-                    )
+            for queue_type, entry in data.league_entries.items():
+                ranks_info.append(
+                    f"Riot ID: {riot_id} - {queue_type}: {entry.tier_name} {entry.division_name} ({entry.league_points} LP)"
+                )
 
         if ranks_info:
             await interaction.response.send_message(f"Ranks for {user.mention}:\n" + "\n".join(ranks_info))
@@ -542,15 +2758,142 @@ async def rank(interaction: discord.Interaction, user: discord.Member = None):
     else:
         await interaction.response.send_message(f"User {user.mention} is not registered with the bot.")
 
-@tasks.loop(minutes=1) 
+@bot.tree.command(name="leaderboard", description="Rank the registered accounts in this server.")
+@app_commands.choices(queue=[
+    app_commands.Choice(name="Solo/Duo", value=QueueType.SOLO_DUO.value),
+    app_commands.Choice(name="Flex", value=QueueType.FLEX.value)
+])
+async def leaderboard(interaction: discord.Interaction, queue: str = QueueType.SOLO_DUO.value, page: app_commands.Range[int, 1] = 1):
+    queue_type = QueueType(queue)
+    member = interaction.guild.get_member if interaction.guild else None
+    total, rows = rank_index.page(queue_type, page, member=member)
+    if not total:
+        await interaction.response.send_message(f"No ranked accounts in {queue_type} yet.")
+        return
+
+    pages = (total + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE
+    if not rows:
+        await interaction.response.send_message(f"There is no page {page}, the {queue_type} leaderboard has {pages} pages.")
+        return
+
+    lines = [f"**{queue_type} leaderboard** (page {page}/{pages})"]
+    for position, discord_id, riot_id in rows:
+        entry = player_data[discord_id][riot_id].league_entries[queue_type]
+        name = member(discord_id).display_name if member else f"<@{discord_id}>"
+        lines.append(f"{position}. {name} ({riot_id}): {entry.tier_name} {entry.division_name}, {entry.league_points} LP")
+    await interaction.response.send_message("\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
+
+@bot.tree.command(name="stats", description="Show recent results from the match history.")
+@app_commands.choices(queue=[app_commands.Choice(name=streak_type.value, value=streak_type.value) for streak_type in StreakType])
+async def match_stats(interaction: discord.Interaction, queue: str, user: discord.Member = None, games: app_commands.Range[int, 1, MATCH_HISTORY_GAMES] = 20):
+    if not user:
+        user = interaction.user
+
+    if user.id not in player_data:
+        await interaction.response.send_message(f"User {user.mention} is not registered with the bot.")
+        return
+
+    streak_type = StreakType(queue)
+    stats_info = []
+    for riot_id, data in player_data[user.id].items():
+        history = match_history.histories.get(data.puuid)
+        played, wins = history.record(streak_type, games) if history else (0, 0)
+        if not played:
+            stats_info.append(f"{riot_id}: No {streak_type} games logged yet")
+            continue
+        streak = history.streak(streak_type)
+        current = f"{streak.wins} win streak" if streak.wins else f"{streak.losses} loss streak"
+        stats_info.append(
+            f"{riot_id}: last {played} {streak_type} games {wins}W {played - wins}L ({wins / played:.0%}), {current}"
+        )
+    await interaction.response.send_message(f"Stats for {user.mention}:\n" + "\n".join(stats_info))
+
+@bot.tree.command(name="botstats", description="Show where the bot spends its time.")
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+async def botstats(interaction: discord.Interaction):
+    # guild_permissions only exists on members, so a DM can't pass this check
+    if interaction.guild is None or not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("Only administrators can use this command.", ephemeral=True)
+        return
+
+    metrics.collect()
+    cycles = metrics.summary("lolbot_poll_cycle_seconds")
+    cycle_count, cycle_total = (cycles[0][1], cycles[0][2]) if cycles else (0, 0.0)
+    lines = [
+        f"**Poll cycle**: {poll_stats['due']} due, {poll_stats['skipped']} skipped, {poll_stats['active']} active, "
+        f"last {poll_stats['duration']:.1f}s, avg {cycle_total / max(cycle_count, 1):.1f}s over {cycle_count} cycles, "
+        f"{int(metrics.counters.get(('lolbot_poll_cycle_overruns_total', ()), 0))} overruns",
+    ]
+
+    # Riot calls by endpoint, most total time first
+    endpoints = defaultdict(lambda: [0, 0.0, 0])  # endpoint -> [calls, seconds, errors]
+    for labels, count, total in metrics.summary("lolbot_riot_request_seconds"):
+        stats = endpoints[labels["endpoint"]]
+        stats[0] += count
+        stats[1] += total
+        if labels["status"] != "200":
+            stats[2] += count
+    lines.append("**Riot calls** (calls, avg, non-200):")
+    for endpoint, (count, total, errors) in sorted(endpoints.items(), key=lambda item: -item[1][1]):
+        lines.append(f"- {endpoint}: {count}, {total / count * 1000:.0f} ms, {errors}")
+
+    limiter = rate_limiter.snapshot()
+    headroom = ", ".join(f"{region} {remaining}" for region, remaining in limiter["app"].items())
+    lines.append(f"**Rate limiter**: {rate_limiter.total_wait:.1f}s waited in total, headroom {headroom or 'unknown'}")
+    for lane, stats in limiter["lanes"].items():
+        lines.append(
+            f"- {lane}: {stats['queued']} queued, {stats['requests']} calls, "
+            f"avg wait {stats['wait'] / max(stats['requests'], 1) * 1000:.0f} ms"
+        )
+    not_closed = {key: state for key, state in circuit_breakers.snapshot().items() if state != "closed"}
+    lines.append(f"**Circuit breakers**: {', '.join(f'{key} {state}' for key, state in not_closed.items()) or 'all closed'}")
+    lines.append(
+        f"**Saves**: {save_stats['flushes']} flushes, last {save_stats['last_seconds'] * 1000:.0f} ms, "
+        f"{save_stats['accounts_written']} accounts, {save_stats['bytes_written']} bytes"
+    )
+    lines.append(
+        f"**Caches**: matches {match_cache.hits} hits / {match_cache.disk_hits} disk / {match_cache.misses} misses, "
+        f"users {user_resolver.stats['gateway_hits'] + user_resolver.stats['cache_hits']} hits / {user_resolver.stats['misses']} misses, "
+        f"mastery {mastery_cache.hits} hits / {mastery_cache.misses} misses, "
+        f"Riot calls shared {sum(c['coalesced'] + c['cached'] for c in single_flight.stats.values())}"
+    )
+    if startup_stats:
+        lines.append("**Startup**: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_stats.items()))
+    lag = metrics.gauges.get(("lolbot_event_loop_last_lag_seconds", ()))
+    lines.append(f"**Event loop lag**: {lag * 1000:.1f} ms" if lag is not None else "**Event loop lag**: not measured yet")
+    await interaction.response.send_message("\n".join(lines)[:2000], ephemeral=True)
+
+@tasks.loop(seconds=POLL_TICK_SECONDS) 
 async def update_checker():
+    started = time.monotonic()
     try:
         await check_for_updates()
     except Exception as e:
+        metrics.inc("lolbot_poll_cycle_errors_total")
         print(f"Error in update_checker: {e}")
+    duration = time.monotonic() - started
+    metrics.observe("lolbot_poll_cycle_seconds", duration)
+
+    # A cycle longer than the tick delays the next one, which delays every due account
+    overrun = max(duration - POLL_TICK_SECONDS, 0)
+    metrics.set("lolbot_poll_cycle_overrun_seconds", overrun)
+    if overrun:
+        metrics.inc("lolbot_poll_cycle_overruns_total")
 
 @update_checker.before_loop
 async def before_update_checker():
     await bot.wait_until_ready()
 
-bot.run(bot_token)
+async def main():
+    async with bot:
+        try:
+            await bot.start(bot_token)
+        finally:
+            await save_player_data()
+            await close_http_session()
+            if poll_workers:
+                poll_workers.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())